@@ -0,0 +1,134 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## Times the name search engines against the pandas str.contains filter the
+## query_* methods used to run, and checks they all return the same rows.
+## Run it from the search_part directory, after the indexes are built:
+##     python benchmarks/bench_name_search.py [index_dir]
+
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import name_search  # noqa: E402
+import search_part  # noqa: E402
+
+## (count, name) queries to time, as they'd be passed to query_*_return_all.
+PART_QUERIES = [(2, "R"), (2, "C_"), (3, "2N7002"), (4, "conn"), (8, "LP2951"),
+                (14, "74hc"), (16, "^74.*138"), (40, "conn_01x40")]
+FP_QUERIES = [(2, "R_1206"), (3, "sot-23"), (4, "pinHeader.*2.54.*vertical$"),
+              (8, "soic-8"), (14, "dip"), (16, "^TSSOP"), (40, "pinsocket_2x20")]
+REPEATS = 20
+
+
+def _time(f, repeats=REPEATS):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        f()
+    return (time.perf_counter() - start) / repeats
+
+
+def _pandas_rows(df, name_column, count_column, count, name):
+    filter_df = df[df[count_column] == count]
+    filter_df = filter_df[filter_df[name_column].str.contains(name.upper(), case=False, regex=True)]
+    return df.index.get_indexer(filter_df.index)
+
+
+def bench_queries(index, name_column, count_column, queries):
+    """Times each engine, through the index's match_rows with its query
+    cache cleared, against the pandas filter."""
+    totals = {"pandas": 0.0}
+    for count, name in queries:
+        expected = _pandas_rows(index.df, name_column, count_column, count, name)
+        totals["pandas"] += _time(
+            lambda: _pandas_rows(index.df, name_column, count_column, count, name)
+        )
+        for engine in search_part._ENGINES:
+            # the first call builds the engine's structures.
+            index.match_rows(count, name, engine)
+            index.query_cache.clear()
+            rows = index.match_rows(count, name, engine)
+            assert np.array_equal(rows, expected), (engine, count, name)
+
+            def run():
+                index.query_cache.clear()
+                index.match_rows(count, name, engine)
+
+            totals[engine] = totals.get(engine, 0.0) + _time(run)
+    return totals
+
+
+def bench_all_names(index, name_column, queries):
+    """Times each engine searching every name in the index, as a search
+    that isn't narrowed by a count has to."""
+    names = index.names
+    rows = np.arange(len(names), dtype=np.intp)
+    start = time.perf_counter()
+    trigrams = name_search.TrigramIndex(names)
+    blob = name_search.NameBlob(list(names))
+    print(f"footprint trigrams and blob built in {time.perf_counter() - start:.3f}s")
+    engines = {
+        "pandas": lambda regex: np.flatnonzero(
+            index.df[name_column].str.contains(regex.pattern, case=False, regex=True)
+        ),
+        "scan": lambda regex: name_search.scan_search(names, rows, regex),
+        "trigram": lambda regex: trigrams.search(names, rows, regex),
+        "blob": lambda regex: blob.search(names, rows, regex),
+    }
+    totals = dict.fromkeys(engines, 0.0)
+    for _, name in queries:
+        regex = re.compile(name.upper(), re.IGNORECASE)
+        expected = engines["pandas"](regex)
+        for engine, search in engines.items():
+            assert np.array_equal(search(regex), expected), (engine, name)
+            totals[engine] += _time(lambda: search(regex), repeats=5)
+    return totals
+
+
+def _report(title, totals, queries):
+    print(title)
+    base = totals["pandas"]
+    for engine, total in totals.items():
+        print(f"  {engine:8s} {total / len(queries) * 1e6:10.1f} us/query"
+              f" {base / total:6.1f}x")
+
+
+if __name__ == "__main__":
+    sp = search_part.SearchPart(index_dir=sys.argv[1] if len(sys.argv) > 1 else None)
+    part_index = sp.part_index
+    fp_index = sp.fp_index
+    print(f"{len(part_index.df)} parts, {len(fp_index.df)} footprints")
+    _report("parts by pin count and name:",
+            bench_queries(part_index, "part_name", "pin_count", PART_QUERIES),
+            PART_QUERIES)
+    _report("footprints by pad count and name:",
+            bench_queries(fp_index, "name", "pad_count", FP_QUERIES),
+            FP_QUERIES)
+    _report("footprints by name only:",
+            bench_all_names(fp_index, "name", FP_QUERIES), FP_QUERIES)
@@ -0,0 +1,238 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## Times the indexers, index loading, the query_* methods and create_part
+## against synthetic libraries (see synthetic.py) and writes the results to
+## json. skidl.Part is replaced by a stand-in so only search_part's own work
+## is timed. Compare two runs with --compare to spot a regression.
+##     python benchmarks/bench_suite.py --scale medium --out results.json
+##     python benchmarks/bench_suite.py --compare old.json --out new.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+sys.path.insert(0, str(REPO / "indexes"))
+sys.path.insert(0, str(REPO / "benchmarks"))
+
+import synthetic  # noqa: E402
+
+## (footprint_libs, footprints_per_lib, symbol_libs, parts_per_lib)
+SCALES = {
+    "small": (5, 50, 5, 100),
+    "medium": (20, 200, 20, 300),
+    "large": (100, 300, 60, 400),
+}
+
+## (count, name) queries that hit the synthetic families.
+PART_QUERIES = [(2, "R_"), (2, "^C_"), (8, "LM358"), (14, "74HC"),
+                (3, "2N7002"), (4, "conn_01x04"), (40, "Conn_02x20"), (64, "ATmega")]
+FP_QUERIES = [(2, "R_0805"), (2, "C_.*1206"), (8, "SOIC-8"), (14, "DIP-14"),
+              (3, "SOT-23"), (4, "PinHeader_1x04.*Vertical"), (40, "pinheader_2x20"),
+              (5, "JST_XH")]
+
+
+class _StubPart(object):
+    """Stands in for skidl.Part, keeping the arguments."""
+
+    def __init__(self, lib=None, name=None, dest=None, footprint=None, **kwargs):
+        self.lib = lib
+        self.name = name
+        self.footprint = footprint
+        self.attribs = kwargs
+
+    def copy(self, **attribs):
+        return _StubPart(self.lib, self.name, footprint=self.footprint, **attribs)
+
+
+def _timed(f, repeats, setup=None):
+    """Returns {"min", "mean", "repeats"} seconds for f()."""
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "mean": sum(times) / len(times), "repeats": repeats}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "-C", str(REPO), "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_indexers(modules, library, index_dir, workers, repeats):
+    """Times full and no change re-index runs of both indexers in
+    index_dir, leaving the indexes there."""
+    # the indexers write to and log in the working directory.
+    os.chdir(index_dir)
+    import index_footprints
+    import index_parts
+
+    results = {}
+    results["create_footprint_index"] = _timed(
+        lambda: index_footprints.create_footprint_index(
+            modules, workers=workers, incremental=False
+        ),
+        repeats,
+    )
+    results["create_footprint_index_unchanged"] = _timed(
+        lambda: index_footprints.create_footprint_index(modules, workers=workers),
+        repeats,
+    )
+    results["create_part_index"] = _timed(
+        lambda: index_parts.create_part_index(
+            library, workers=workers, incremental=False
+        ),
+        repeats,
+    )
+    results["create_part_index_unchanged"] = _timed(
+        lambda: index_parts.create_part_index(library, workers=workers), repeats
+    )
+    return results
+
+
+def bench_search(index_dir, repeats):
+    """Times loading the indexes, each query_* method with and without
+    its query cache, and create_part with skidl.Part stubbed."""
+    import search_part
+
+    # SearchPart looks for the indexes directory in the working directory.
+    os.chdir(index_dir.parent)
+    search_part.skidl = types.SimpleNamespace(
+        Part=_StubPart, TEMPLATE="TEMPLATE", Circuit=object
+    )
+    results = {}
+
+    def load():
+        sp = search_part.SearchPart()
+        sp.part_df, sp.fp_df
+        sp.close()
+
+    results["load_indexes"] = _timed(load, repeats, search_part.clear_index_cache)
+    results["load_indexes_shared"] = _timed(load, repeats)
+
+    sp = search_part.SearchPart()
+    sp.part_df, sp.fp_df
+    methods = [
+        ("query_part", PART_QUERIES),
+        ("query_part_return_all", PART_QUERIES),
+        ("query_footprint", FP_QUERIES),
+        ("query_footprint_return_all", FP_QUERIES),
+    ]
+    for method, queries in methods:
+        f = getattr(sp, method)
+
+        def run_all():
+            for count, name in queries:
+                try:
+                    f(count, name)
+                except IndexError:
+                    pass
+
+        results[method] = _timed(run_all, repeats, sp.clear_query_cache)
+        results[method + "_cached"] = _timed(run_all, repeats)
+
+    pairs = list(zip(PART_QUERIES, FP_QUERIES))
+
+    def create_parts():
+        for (pins, name), (pads, fp_name) in pairs:
+            try:
+                sp.create_part(pins, name, fp_name, pads, value="x")
+            except IndexError:
+                pass
+
+    results["create_part"] = _timed(create_parts, repeats, sp.clear_query_cache)
+    sp.close()
+    return results
+
+
+def compare(old_file, results):
+    with open(old_file, "r", encoding="UTF-8") as o_file:
+        old = json.load(o_file)["results"]
+    print(f"{'benchmark':36s} {'old ms':>10s} {'new ms':>10s} {'ratio':>7s}")
+    for name, result in results.items():
+        if name not in old:
+            continue
+        before = old[name]["min"] * 1e3
+        after = result["min"] * 1e3
+        print(f"{name:36s} {before:10.2f} {after:10.2f} {after / before:7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times search_part on synthetic libraries.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--work-dir", help="where the libraries are written, default a temp dir")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="an earlier results file to compare against")
+    args = parser.parse_args()
+
+    out_file = Path(args.out).resolve()
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="search_part_bench_"))
+    fp_libs, fps, sym_libs, parts = SCALES[args.scale]
+    start = time.perf_counter()
+    modules, library = synthetic.generate(work_dir, fp_libs, fps, sym_libs, parts)
+    print(f"Generated {fp_libs * fps} footprints and {sym_libs * parts} parts"
+          f" in {time.perf_counter() - start:.1f}s at {work_dir}")
+    index_dir = work_dir / "indexes"
+    index_dir.mkdir(exist_ok=True)
+
+    results = bench_indexers(modules, library, index_dir, args.workers, args.repeats)
+    results.update(bench_search(index_dir, args.repeats))
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "footprints": fp_libs * fps,
+            "parts": sym_libs * parts,
+            "workers": args.workers,
+        },
+        "results": results,
+    }
+    with open(out_file, "w", encoding="UTF-8") as r_file:
+        json.dump(report, r_file, indent=1)
+    print(f"Results written to {out_file}")
+    if args.compare:
+        compare(args.compare, results)
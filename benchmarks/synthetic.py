@@ -0,0 +1,158 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## Writes KiCad 5 style footprint and symbol libraries full of made up but
+## plausible parts so the indexers and SearchPart can be timed without a
+## KiCad install. The same seed always writes the same files.
+##     python benchmarks/synthetic.py <dir> [footprint_libs] [symbol_libs]
+
+import random
+import sys
+from pathlib import Path
+
+## (name format, pin or pad counts) families. {n} is the count, {i} a
+## number that keeps the names unique.
+FOOTPRINT_FAMILIES = [
+    ("R_{size}_{i}", [2]),
+    ("C_{size}_{i}", [2]),
+    ("SOIC-{n}_3.9x4.9mm_P1.27mm_{i}", [8, 14, 16]),
+    ("DIP-{n}_W7.62mm_{i}", [8, 14, 16, 20, 28, 40]),
+    ("TSSOP-{n}_4.4x5mm_P0.65mm_{i}", [8, 14, 16, 20, 24]),
+    ("SOT-23-{n}_{i}", [3, 5, 6]),
+    ("PinHeader_1x{n:02d}_P2.54mm_Vertical_{i}", list(range(1, 41))),
+    ("PinHeader_2x{h:02d}_P2.54mm_Vertical_{i}", list(range(2, 81, 2))),
+    ("PinSocket_1x{n:02d}_P2.54mm_Horizontal_{i}", list(range(1, 41))),
+    ("JST_XH_B{n}B-XH-A_1x{n:02d}_P2.50mm_Vertical_{i}", list(range(2, 17))),
+]
+PART_FAMILIES = [
+    ("R_{i}", [2]),
+    ("C_{i}", [2]),
+    ("LM358_{i}", [8]),
+    ("LP2951-{i}", [8]),
+    ("74HC{i:02d}", [14, 16, 20]),
+    ("2N7002_{i}", [3]),
+    ("Conn_01x{n:02d}_{i}", list(range(1, 41))),
+    ("Conn_02x{h:02d}_{i}", list(range(2, 81, 2))),
+    ("ATmega{i}-AU", [32, 44, 64]),
+]
+SIZES = ["0402", "0603", "0805", "1206", "2512"]
+
+
+def _name(family, count, i, rng):
+    fmt, _ = family
+    return fmt.format(n=count, h=count // 2, i=i, size=rng.choice(SIZES))
+
+
+def write_kicad_mod(file_path, name, pads):
+    lines = [
+        f"(module {name} (layer F.Cu) (tedit 5B307E4C)",
+        f'  (descr "{name}, made up for benchmarking")',
+        '  (tags "synthetic")',
+        "  (fp_text reference REF** (at 0 -2) (layer F.SilkS)",
+        "    (effects (font (size 1 1) (thickness 0.15)))",
+        "  )",
+        "  (fp_line (start -1 -1) (end 1 -1) (layer F.Fab) (width 0.1))",
+    ]
+    for pad in range(1, pads + 1):
+        lines.append(
+            f"  (pad {pad} thru_hole oval (at 0 {2.54 * (pad - 1):.2f}) "
+            "(size 1.7 1.7) (drill 1) (layers *.Cu *.Mask))"
+        )
+    lines += [
+        "  (model ${KISYS3DMOD}/synthetic.wrl",
+        "    (at (xyz 0 0 0))",
+        "  )",
+        ")",
+    ]
+    file_path.write_text("\n".join(lines) + "\n", encoding="UTF-8")
+
+
+def _part_lines(name, pins, aliases):
+    lines = [
+        "#",
+        f"# {name}",
+        "#",
+        f"DEF {name} U 0 40 Y Y 1 F N",
+        'F0 "U" 0 0 50 H V C CNN',
+        f'F1 "{name}" 0 -100 50 H V C CNN',
+        'F2 "" 0 0 50 H I C CNN',
+        'F3 "" 0 0 50 H I C CNN',
+    ]
+    if aliases:
+        lines.append("ALIAS " + " ".join(aliases))
+    lines += ["DRAW", "S -200 200 200 -200 0 1 10 f"]
+    for pin in range(1, pins + 1):
+        lines.append(f"X P{pin} {pin} -300 {100 * pin} 100 R 50 50 1 1 P")
+    lines += ["ENDDRAW", "ENDDEF"]
+    return lines
+
+
+def generate(
+    root,
+    footprint_libs=10,
+    footprints_per_lib=100,
+    symbol_libs=10,
+    parts_per_lib=200,
+    seed=2020,
+):
+    """Writes root/modules/*.pretty/*.kicad_mod and root/library/*.lib.
+    Returns (modules dir, library dir)."""
+    rng = random.Random(seed)
+    root = Path(root)
+    modules = root / "modules"
+    library = root / "library"
+
+    for lib in range(footprint_libs):
+        lib_dir = modules / f"Synthetic_{lib}.pretty"
+        lib_dir.mkdir(parents=True, exist_ok=True)
+        for i in range(footprints_per_lib):
+            family = rng.choice(FOOTPRINT_FAMILIES)
+            pads = rng.choice(family[1])
+            name = _name(family, pads, lib * footprints_per_lib + i, rng)
+            write_kicad_mod(lib_dir / f"{name}.kicad_mod", name, pads)
+
+    library.mkdir(parents=True, exist_ok=True)
+    for lib in range(symbol_libs):
+        lines = ["EESchema-LIBRARY Version 2.4", "#encoding utf-8"]
+        for i in range(parts_per_lib):
+            family = rng.choice(PART_FAMILIES)
+            pins = rng.choice(family[1])
+            name = _name(family, pins, lib * parts_per_lib + i, rng)
+            aliases = []
+            if rng.random() < 0.2:
+                aliases = [f"{name}A", f"{name}B"]
+            lines += _part_lines(name, pins, aliases)
+        lines += ["#", "#End Library"]
+        (library / f"Synthetic_{lib}.lib").write_text(
+            "\n".join(lines) + "\n", encoding="UTF-8"
+        )
+
+    return modules, library
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[2:4]]
+    fp_libs = counts[0] if counts else 10
+    sym_libs = counts[1] if len(counts) > 1 else 10
+    print(generate(sys.argv[1], footprint_libs=fp_libs, symbol_libs=sym_libs))
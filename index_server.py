@@ -0,0 +1,241 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## A long running process that keeps the part and footprint indexes loaded
+## and answers queries for the SearchParts of short lived scripts over a
+## Unix domain socket, so they don't have to load the indexes themselves.
+## Start it from the directory holding indexes/ with
+##     python3 index_server.py
+## and make the SearchParts with SearchPart(server=True).
+##
+## Each message is a 4 byte big endian length followed by that many bytes
+## of JSON. A request is [method, count, name] (plus by_pad_count for
+## query_footprint_return_all), the answer is [0, result] or
+## [1, exception class name, message]. A _return_all result is
+## [row labels, column names, [values of each column]].
+
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+from pathlib import Path
+
+SOCKET_NAME = "skidl_index.sock"
+_LENGTH = struct.Struct(">I")
+_METHODS = {
+    "query_part",
+    "query_part_return_all",
+    "query_footprint",
+    "query_footprint_return_all",
+}
+
+
+def write_message(s_file, message):
+    data = json.dumps(message, separators=(",", ":")).encode("UTF-8")
+    s_file.write(_LENGTH.pack(len(data)) + data)
+
+
+def read_message(s_file):
+    """Returns the next message from the binary file s_file, or None if
+    the other end has closed the connection."""
+    header = s_file.read(_LENGTH.size)
+    if len(header) < _LENGTH.size:
+        return None
+    (length,) = _LENGTH.unpack(header)
+    data = s_file.read(length)
+    if len(data) < length:
+        return None
+    return json.loads(data)
+
+
+def socket_path(index_dir):
+    return Path(index_dir) / SOCKET_NAME
+
+
+class IndexClient(object):
+    """One connection to an index server. Raises OSError if there is no
+    server listening at socket_file."""
+
+    def __init__(self, socket_file, timeout=10.0):
+        self.socket_file = Path(socket_file)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.settimeout(timeout)
+            self._sock.connect(str(self.socket_file))
+        except OSError:
+            self._sock.close()
+            raise
+        self._rfile = self._sock.makefile("rb")
+        self._wfile = self._sock.makefile("wb")
+        self._lock = threading.Lock()
+
+    def request(self, *request):
+        """Returns the answer to the request as (ok, result) where result
+        is (class name, message) of the exception the server raised when
+        ok is False. Raises OSError if the server has gone."""
+        with self._lock:
+            write_message(self._wfile, list(request))
+            self._wfile.flush()
+            answer = read_message(self._rfile)
+        if answer is None:
+            raise ConnectionError(
+                f"The index server at {self.socket_file} has gone"
+            )
+        if answer[0] == 0:
+            return True, answer[1]
+        return False, (answer[1], answer[2])
+
+    def close(self):
+        for s_file in (self._rfile, self._wfile, self._sock):
+            try:
+                s_file.close()
+            except OSError:
+                pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # a client keeps its connection open for all its queries.
+        while True:
+            try:
+                request = read_message(self.rfile)
+            except ValueError:
+                return
+            if request is None:
+                return
+            write_message(self.wfile, self.server.answer(request))
+
+
+class IndexServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answers queries from the SearchPart it holds. The indexes are loaded
+    when it starts and again if their files change. Queries are answered
+    one at a time, each takes microseconds once an index is loaded."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_file, index_dir=None, engine="scan"):
+        # imported here as search_part imports this module for the client.
+        from search_part import SearchPart
+
+        self.search = SearchPart(engine=engine, index_dir=index_dir)
+        self.socket_file = Path(socket_file)
+        self._lock = threading.Lock()
+        self._load()
+        if self.socket_file.exists():
+            try:
+                IndexClient(self.socket_file).close()
+            except OSError:
+                # left behind by a server that didn't shut down cleanly.
+                self.socket_file.unlink()
+            else:
+                raise Exception(
+                    f"An index server is already running at {socket_file}"
+                )
+        super().__init__(str(self.socket_file), _Handler)
+
+    def _load(self):
+        # the properties load the indexes on first use.
+        self.search.part_index
+        self.search.fp_index
+
+    def _check_files(self):
+        """Loads the indexes again if their files have changed."""
+        for index_file, mtime, size in self.search._index_keys:
+            # the key holds the resolved path, a stat is all it takes.
+            try:
+                stat = os.stat(index_file)
+                changed = (stat.st_mtime_ns, stat.st_size) != (mtime, size)
+            except FileNotFoundError:
+                changed = True
+            if changed:
+                print("Index files have changed, loading them again.")
+                self.search.close()
+                self._load()
+                return
+
+    def answer(self, request):
+        try:
+            method = request[0]
+            if method not in _METHODS:
+                raise ValueError(f"Unknown request:{method}")
+            with self._lock:
+                self._check_files()
+                result = getattr(self.search, method)(*request[1:])
+                if method.endswith("_return_all"):
+                    result = [
+                        result.index.tolist(),
+                        result.columns.tolist(),
+                        [result[c].tolist() for c in result.columns],
+                    ]
+                else:
+                    result = [str(r) for r in result]
+        except Exception as e:
+            return [1, type(e).__name__, str(e)]
+        return [0, result]
+
+    def server_close(self):
+        super().server_close()
+        try:
+            self.socket_file.unlink()
+        except FileNotFoundError:
+            pass
+        self.search.close()
+
+
+def serve(index_dir=None, socket_file=None, engine="scan"):
+    """Answers queries until interrupted or sent SIGTERM. index_dir defaults
+    to indexes/ in the current directory and socket_file to
+    skidl_index.sock in index_dir."""
+    if index_dir is None:
+        index_dir = Path.cwd() / "indexes"
+    if socket_file is None:
+        socket_file = socket_path(index_dir)
+    # leave through the with so the socket file is removed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with IndexServer(socket_file, index_dir, engine) as server:
+        print(f"Index server for {index_dir} listening at {socket_file}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Keeps the indexes loaded and answers SearchPart queries."
+    )
+    parser.add_argument("--index-dir", help="defaults to ./indexes")
+    parser.add_argument(
+        "--socket", help=f"defaults to {SOCKET_NAME} in the index directory"
+    )
+    parser.add_argument(
+        "--engine", default="scan", choices=["scan", "trigram", "blob"]
+    )
+    args = parser.parse_args()
+    serve(args.index_dir, args.socket, args.engine)
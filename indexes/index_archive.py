@@ -0,0 +1,71 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## Reading KiCad libraries straight out of a .zip or .tar.* bundle. The
+## members are read in the order they are stored, one at a time, and
+## nothing is written to disk. A member's name is its path inside the
+## bundle, so pack the bundle from the library directory itself
+## (tar czf footprints.tgz -C /usr/share/kicad/modules .) to get the same
+## names an index of the directory has.
+
+import hashlib
+import tarfile
+import zipfile
+from pathlib import PurePosixPath
+
+_TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+def is_archive(path):
+    name = str(path).lower()
+    return name.endswith(".zip") or name.endswith(_TAR_SUFFIXES)
+
+
+def archive_members(archive_path, suffixes):
+    """Yields (name, data) for every file in the archive whose name ends
+    with one of suffixes. name is the member's path inside the archive
+    and data its bytes. A tar is read as a stream in a single pass so a
+    compressed bundle is never seeked or unpacked."""
+    if str(archive_path).lower().endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as z_file:
+            for info in z_file.infolist():
+                if not info.is_dir() and info.filename.endswith(suffixes):
+                    yield _member_name(info.filename), z_file.read(info)
+    else:
+        with tarfile.open(archive_path, mode="r|*") as t_file:
+            for member in t_file:
+                if member.isfile() and member.name.endswith(suffixes):
+                    data = t_file.extractfile(member).read()
+                    yield _member_name(member.name), data
+
+
+def member_record(data):
+    """The manifest record of a member. There is no mtime, a bundle is
+    always indexed in full."""
+    return {"size": len(data), "sha1": hashlib.sha1(data).hexdigest()}
+
+
+def _member_name(name):
+    # drops the ./ tar puts in front of names packed from "."
+    return PurePosixPath(name).as_posix()
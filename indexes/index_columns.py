@@ -0,0 +1,158 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## A binary copy of an index csv that loads without parsing any text.
+## skidl_part_index.csv gets a skidl_part_index_columns directory holding
+## columns.json, a <column>.npy file for each count column and a
+## <column>.str.npy file for each text column. The text files are the
+## column's UTF-8 strings, each ended by a newline, stored as a uint8 array.
+## The count columns are memory mapped when they are read. The text columns
+## are mapped too but each one is decoded into str objects in one go, so
+## loading them is a faster parse rather than free. columns.json records
+## the size and mtime of the csv so a copy that is out of date is ignored.
+## The copy is written from _CHUNK_ROWS rows of the csv at a time.
+
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+
+def columns_dir(csv_file):
+    csv_path = Path(csv_file)
+    return csv_path.with_name(csv_path.stem + "_columns")
+
+
+def _csv_stamp(csv_path):
+    stat = csv_path.stat()
+    return {"csv_size": stat.st_size, "csv_mtime": stat.st_mtime_ns}
+
+
+_CHUNK_ROWS = 10000
+
+
+def write_columns(csv_file):
+    """Writes the binary column copy of csv_file next to it."""
+    import pandas as pd
+
+    csv_path = Path(csv_file)
+    col_path = columns_dir(csv_path)
+    col_path.mkdir(exist_ok=True)
+    (col_path / "columns.json").unlink(missing_ok=True)
+
+    # each column's values are appended to a raw file a chunk at a time
+    # and given their .npy header once the number of them is known.
+    names = pd.read_csv(csv_path, nrows=0).columns
+    raw_files = {column: open(col_path / f"{column}.raw", "wb") for column in names}
+    rows = 0
+    try:
+        chunks = pd.read_csv(
+            csv_path, dtype=str, keep_default_na=False, chunksize=_CHUNK_ROWS
+        )
+        for chunk in chunks:
+            rows += len(chunk)
+            for column in names:
+                if column.endswith("_count"):
+                    data = chunk[column].astype("int64").to_numpy().tobytes()
+                else:
+                    data = "".join(v + "\n" for v in chunk[column]).encode("utf-8")
+                raw_files[column].write(data)
+    finally:
+        for raw_file in raw_files.values():
+            raw_file.close()
+
+    columns = {}
+    for column in names:
+        raw_path = col_path / f"{column}.raw"
+        if column.endswith("_count"):
+            dtype = np.dtype("int64")
+            _write_npy(raw_path, col_path / f"{column}.npy", dtype, rows)
+            columns[column] = str(dtype)
+        else:
+            size = raw_path.stat().st_size
+            _write_npy(raw_path, col_path / f"{column}.str.npy", np.uint8, size)
+            columns[column] = "str"
+
+    # written last, it is what marks the copy as complete.
+    layout = _csv_stamp(csv_path)
+    layout["rows"] = rows
+    layout["columns"] = columns
+    with open(col_path / "columns.json", "w", encoding="UTF-8") as l_file:
+        json.dump(layout, l_file, indent=1)
+
+
+def _write_npy(raw_path, npy_path, dtype, length):
+    """Writes npy_path, the .npy file of the length values of dtype in the
+    file raw_path, and removes raw_path."""
+    header = {
+        "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        "fortran_order": False,
+        "shape": (length,),
+    }
+    with open(npy_path, "wb") as npy_file, open(raw_path, "rb") as raw_file:
+        np.lib.format.write_array_header_1_0(npy_file, header)
+        shutil.copyfileobj(raw_file, npy_file)
+    raw_path.unlink()
+
+
+def read_columns(csv_file, columns=None):
+    """Returns the DataFrame held in the binary copy of csv_file, or None
+    if there is no copy or it is older than the csv. columns picks the
+    columns to read, by default all of them. The counts stay memory
+    mapped, the text is decoded into str objects."""
+    import pandas as pd
+
+    csv_path = Path(csv_file)
+    col_path = columns_dir(csv_path)
+    try:
+        with open(col_path / "columns.json", "r", encoding="UTF-8") as l_file:
+            layout = json.load(l_file)
+    except (OSError, ValueError):
+        return None
+    stamp = _csv_stamp(csv_path)
+    if (layout["csv_size"], layout["csv_mtime"]) != (
+        stamp["csv_size"],
+        stamp["csv_mtime"],
+    ):
+        return None
+
+    if columns is None:
+        columns = list(layout["columns"])
+    elif not set(columns) <= set(layout["columns"]):
+        return None
+
+    data = {}
+    for column in columns:
+        dtype = layout["columns"][column]
+        if layout["rows"] == 0:
+            # numpy can't map an empty array.
+            data[column] = np.array([], dtype=object if dtype == "str" else dtype)
+        elif dtype == "str":
+            blob = np.load(col_path / f"{column}.str.npy", mmap_mode="r")
+            data[column] = str(memoryview(blob), "utf-8").split("\n")[:-1]
+        else:
+            data[column] = np.load(col_path / f"{column}.npy", mmap_mode="r")
+
+    return pd.DataFrame(data)
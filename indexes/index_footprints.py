@@ -25,37 +25,331 @@
 from pyparsing import *
 
 import pandas as pd
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+from multiprocessing import Pool
+import io
 import logging
+import os
+import re
+
+from index_archive import archive_members, is_archive, member_record
+from index_columns import write_columns
+from index_sexpr import lists
+from index_stats import make_stats, phase
+from index_manifest import (
+    check_files,
+    load_manifest,
+    relative_name,
+    save_manifest,
+)
 
 logging.basicConfig(filename="footprint_index.log",  level=logging.DEBUG)
 
 
-def create_footprint_index(footprint_file_dir):
+def create_footprint_index(
+    footprint_file_dir, workers=1, chunksize=64, incremental=True, stats=None
+):
+    """Index every .kicad_mod file below footprint_file_dir.
+    footprint_file_dir can also be a .zip or .tar.* bundle of the
+    directory, its members are parsed as they are read without unpacking
+    it. A bundle is always indexed in full.
+    workers > 1 parses the files in a process pool, handing each worker
+    chunksize files at a time. The csv is the same as a serial run.
+    incremental=True only parses the files added or changed since the
+    manifest was written, rows for deleted files are dropped.
+    stats=True (or an index_stats.Stats) records how long each phase took
+    and what was read, the Stats is returned."""
+    stats = make_stats(stats, "Footprint index")
     file_path = Path(footprint_file_dir)
+    assert isinstance(workers, int) and workers > 0
+    if is_archive(file_path) and file_path.is_file():
+        return _create_footprint_index_from_archive(
+            file_path, workers, chunksize, stats
+        )
     assert file_path.exists() and file_path.is_dir()
-    mod_list = file_path.glob("**/*.kicad_mod")
-    # print(list(mod_list))
-    found_fp = {"name": [], "pad_count": [], "location": []}
     print(f"Starting indexing of directory:{file_path}")
-    for k_mod_file in mod_list:
-        print(k_mod_file)
-        try:
-            name, num_pads = _parse_kicad_mod(k_mod_file)
-            found_fp["name"].append(name)
-            found_fp["pad_count"].append(num_pads)
-            found_fp["location"].append(Path(k_mod_file).parent.name)
-           # found_fp["pad_size_info"].append(size_info)
-
-        except ParseException:
-            logging.error(f"Parse Error when parsing {k_mod_file}")
-            
+
+    with phase(stats, "find files"):
+        mod_list = sorted(file_path.glob("**/*.kicad_mod"))
+        old_records = {}
+        old_df = None
+        if incremental and Path("skidl_footprint_index.csv").is_file():
+            old_records = load_manifest("skidl_footprint_manifest.json", file_path)
+            # older versions wrote the pandas index as an unnamed column.
+            old_df = pd.read_csv(
+                "skidl_footprint_index.csv", keep_default_na=False
+            ).drop(columns="Unnamed: 0", errors="ignore")
+            if "source" not in old_df.columns:
+                # made before there was a manifest.
+                old_records = {}
+        records, changed = check_files(file_path, mod_list, old_records)
+    print(f"{len(changed)} of {len(mod_list)} footprint files to parse.")
+
+    found_fp = {"name": [], "pad_count": [], "location": [], "source": []}
+    with phase(stats, "parse"):
+        if workers == 1:
+            results = map(_index_kicad_mod, changed)
+            _collect_footprints(results, found_fp, file_path, records)
+        else:
+            # imap keeps the glob order so the rows match a serial run.
+            with Pool(processes=workers) as pool:
+                results = pool.imap(_index_kicad_mod, changed, chunksize=chunksize)
+                _collect_footprints(results, found_fp, file_path, records)
+    if stats is not None:
+        stats.count("files found", len(mod_list))
+        stats.count("files parsed", len(changed))
+        stats.count("files with errors", len(changed) - len(found_fp["name"]))
+        for k_mod_file in changed:
+            rel = relative_name(k_mod_file, file_path)
+            stats.read(rel, k_mod_file.stat().st_size)
+
+    fp_df = pd.DataFrame(found_fp)
+    if old_records:
+        # keep the rows of the unchanged files then put every row back in
+        # file order so the csv is the same as a full re-index.
+        changed_names = {relative_name(f, file_path) for f in changed}
+        keep = old_df.source.isin(records.keys()) & ~old_df.source.isin(
+            changed_names
+        )
+        fp_df = pd.concat([old_df[keep], fp_df], ignore_index=True)
+        fp_df = fp_df.astype({"pad_count": "int64"})
+        file_order = {name: i for i, name in enumerate(sorted(records))}
+        fp_df = fp_df.iloc[
+            fp_df.source.map(file_order).argsort(kind="stable")
+        ].reset_index(drop=True)
+
+    _write_index(fp_df, file_path, records, stats)
+    return stats
+
+
+def create_footprint_index_from_cache(
+    footprint_file_dir, fp_info_cache, workers=1, chunksize=64, stats=None
+):
+    """Index every .kicad_mod file below footprint_file_dir, taking the
+    names and pad counts from the fp-info-cache file KiCad writes next to
+    a project instead of parsing the files.
+    A library is parsed as create_footprint_index would if it isn't in the
+    cache, its footprints differ from the ones the cache lists, or any of
+    its files is newer than the cache.
+    KiCad counts every pad that isn't a plain hole, the parser only counts
+    the numbered pads in the first run of pads (so not BGA pads like A1).
+    The first, middle and last files of each library are parsed and if
+    any name or pad count differs from the cache the whole library is
+    parsed. A library
+    that passes takes the cache's counts for the files that weren't
+    sampled, these can still differ from a full parse.
+    workers and chunksize are as for create_footprint_index."""
+    stats = make_stats(stats, "Footprint index")
+    file_path = Path(footprint_file_dir)
+    assert file_path.exists() and file_path.is_dir()
+    assert isinstance(workers, int) and workers > 0
+    cache_path = Path(fp_info_cache)
+    assert cache_path.is_file()
+    print(f"Starting indexing of directory:{file_path} from {cache_path}")
+
+    with phase(stats, "read cache"):
+        cached = _read_fp_info_cache(cache_path)
+    if stats is not None:
+        stats.read(cache_path.name, cache_path.stat().st_size)
+
+    with phase(stats, "find files"):
+        mod_list = sorted(file_path.glob("**/*.kicad_mod"))
+        # KiCad writes one timestamp for the whole cache, not one per
+        # library, so each library is checked against the cache file's
+        # mtime instead.
+        cache_mtime = cache_path.stat().st_mtime_ns
+        libs = {}
+        for k_mod_file in mod_list:
+            libs.setdefault(k_mod_file.parent, []).append(k_mod_file)
+        records = {}
+        from_cache = []
+        changed = []
+        for lib_dir, lib_files in libs.items():
+            lib_cache = cached.get(lib_dir.stem)
+            fresh = lib_dir.suffix == ".pretty" and lib_cache is not None
+            fresh = fresh and set(lib_cache) == {f.stem for f in lib_files}
+            lib_rel = relative_name(lib_dir, file_path)
+            lib_rows = []
+            for k_mod_file in lib_files:
+                stat = k_mod_file.stat()
+                fresh = fresh and stat.st_mtime_ns <= cache_mtime
+                rel = k_mod_file.name
+                if lib_rel != ".":
+                    rel = f"{lib_rel}/{rel}"
+                # no sha1, the next incremental run hashes the file if its
+                # size or mtime have moved on.
+                records[rel] = {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime_ns,
+                    "sha1": None,
+                }
+                if fresh:
+                    lib_rows.append((k_mod_file.stem, rel))
+            if fresh and not _cache_agrees(lib_files, lib_cache, stats):
+                logging.info(f"{lib_dir} doesn't match {cache_path}, parsing it")
+                fresh = False
+            if fresh:
+                from_cache.extend(
+                    (name, lib_cache[name], lib_dir.name, rel) for name, rel in lib_rows
+                )
+            else:
+                changed.extend(lib_files)
+        changed_records, _ = check_files(file_path, changed, {})
+        records.update(changed_records)
+    print(f"{len(changed)} of {len(mod_list)} footprint files to parse.")
+
+    found_fp = {"name": [], "pad_count": [], "location": [], "source": []}
+    for name, num_pads, location, source in from_cache:
+        found_fp["name"].append(name)
+        found_fp["pad_count"].append(num_pads)
+        found_fp["location"].append(location)
+        found_fp["source"].append(source)
+    with phase(stats, "parse"):
+        if workers == 1:
+            results = map(_index_kicad_mod, changed)
+            _collect_footprints(results, found_fp, file_path, records)
+        else:
+            with Pool(processes=workers) as pool:
+                results = pool.imap(_index_kicad_mod, changed, chunksize=chunksize)
+                _collect_footprints(results, found_fp, file_path, records)
+    if stats is not None:
+        stats.count("files found", len(mod_list))
+        stats.count("files from cache", len(from_cache))
+        stats.count("files parsed", len(changed))
+        n_parsed = len(found_fp["name"]) - len(from_cache)
+        stats.count("files with errors", len(changed) - n_parsed)
+        for k_mod_file in changed:
+            rel = relative_name(k_mod_file, file_path)
+            stats.read(rel, k_mod_file.stat().st_size)
+
+    # rows in file order, the same as a full index.
     fp_df = pd.DataFrame(found_fp)
-    fp_df.to_csv("skidl_footprint_index.csv")
+    fp_df = fp_df.iloc[fp_df.source.argsort(kind="stable")].reset_index(drop=True)
+    _write_index(fp_df, file_path, records, stats)
+    return stats
+
+
+def _create_footprint_index_from_archive(archive_path, workers, chunksize, stats):
+    print(f"Starting indexing of archive:{archive_path}")
+    records = {}
+
+    def read_members():
+        for name, data in archive_members(archive_path, (".kicad_mod",)):
+            records[name] = member_record(data)
+            if stats is not None:
+                stats.count("files found")
+                stats.count("files parsed")
+                stats.read(name, len(data))
+            yield PurePosixPath(name), data
+
+    found_fp = {"name": [], "pad_count": [], "location": [], "source": []}
+    # reading and parsing are interleaved, both count as parse time.
+    with phase(stats, "parse"):
+        # member names are already relative to the top of the archive.
+        root = PurePosixPath()
+        if workers == 1:
+            results = map(_index_kicad_mod_member, read_members())
+            _collect_footprints(results, found_fp, root, records)
+        else:
+            with Pool(processes=workers) as pool:
+                results = pool.imap(
+                    _index_kicad_mod_member, read_members(), chunksize=chunksize
+                )
+                _collect_footprints(results, found_fp, root, records)
+    if stats is not None:
+        stats.count("files with errors", len(stats.files) - len(found_fp["name"]))
+    print(f"Parsed {len(found_fp['name'])} footprint files.")
+
+    # members can be stored in any order, the rows are put in file order
+    # to match an index of the unpacked directory.
+    fp_df = pd.DataFrame(found_fp)
+    fp_df = fp_df.iloc[fp_df.source.argsort(kind="stable")].reset_index(drop=True)
+    _write_index(fp_df, archive_path, records, stats)
+    return stats
+
+
+def _cache_agrees(lib_files, lib_cache, stats):
+    """Parses the first, middle and last of lib_files and returns whether
+    their names and pad counts are the ones in lib_cache."""
+    n = len(lib_files)
+    for i in sorted({0, n // 2, n - 1}):
+        k_mod_file = lib_files[i]
+        _, name, num_pads = _index_kicad_mod(k_mod_file)
+        if stats is not None:
+            stats.count("files checked against cache")
+        if name != k_mod_file.stem or num_pads != lib_cache[k_mod_file.stem]:
+            return False
+    return True
+
+
+def _read_fp_info_cache(cache_path):
+    """Returns {library nickname: {footprint name: pad count}} read from
+    an fp-info-cache file. After the timestamp on the first line every
+    footprint takes seven lines: library, name, description, keywords,
+    order, pad count and unique pad count. The file is streamed a
+    footprint at a time."""
+    cached = {}
+    with open(cache_path, "r", encoding="UTF-8") as c_file:
+        timestamp = c_file.readline().strip()
+        if not timestamp.isdigit():
+            raise Exception(f"{cache_path} isn't an fp-info-cache file")
+        for entry in zip(*[c_file] * 7):
+            lib, name, _, _, order, pad_count, _ = entry
+            lib = lib.rstrip("\r\n")
+            name = name.rstrip("\r\n")
+            try:
+                int(order)
+                pad_count = int(pad_count)
+            except ValueError:
+                raise Exception(f"Unexpected entry for {lib}:{name} in {cache_path}")
+            cached.setdefault(lib, {})[name] = pad_count
+    return cached
+
+
+def _write_index(fp_df, file_path, records, stats):
+    with phase(stats, "write"):
+        fp_df.to_csv("skidl_footprint_index.csv", index=False)
+        write_columns("skidl_footprint_index.csv")
+        save_manifest("skidl_footprint_manifest.json", file_path, records)
+    if stats is not None:
+        stats.count("rows", len(fp_df))
 
     print(f"Completed index, see footprint_index.log for any errors.")
 
-def _parse_kicad_mod(file_path):
+
+def _collect_footprints(results, found_fp, file_path, records):
+    for k_mod_file, name, num_pads in results:
+        print(k_mod_file)
+        source = relative_name(k_mod_file, file_path)
+        if name is None:
+            logging.error(f"Parse Error when parsing {k_mod_file}")
+            # leave it out of the manifest so it is tried again next time.
+            del records[source]
+            continue
+        found_fp["name"].append(name)
+        found_fp["pad_count"].append(num_pads)
+        found_fp["location"].append(Path(k_mod_file).parent.name)
+        found_fp["source"].append(source)
+       # found_fp["pad_size_info"].append(size_info)
+
+
+def _index_kicad_mod(k_mod_file):
+    """Parses one footprint file, runs in the pool workers so a parse
+    error is returned rather than raised."""
+    return _index_kicad_mod_member((k_mod_file, Path(k_mod_file).read_bytes()))
+
+
+def _index_kicad_mod_member(member):
+    """As _index_kicad_mod for a (file name, bytes) pair read from an
+    archive."""
+    k_mod_file, data = member
+    try:
+        name, num_pads = _parse_kicad_mod_data(data)
+    except (ParseException, ValueError, UnicodeDecodeError):
+        return k_mod_file, None, None
+    return k_mod_file, str(name), num_pads
+
+def _build_kicad_mod_parser():
     ####footprint parser start
     # look for module name, tags and pad count.
     close_bracket = Literal(")").suppress()
@@ -79,15 +373,150 @@ def _parse_kicad_mod(file_path):
 
     module = name + ZeroOrMore(SkipTo(pad).suppress() + pads + SkipTo(stringEnd).suppress())
 
-    module_toks = module.parseFile(file_path)
+    return module
+
+
+# built once, it is only needed for the files the scanner rejects.
+_kicad_mod_parser = _build_kicad_mod_parser()
+
+
+def _parse_kicad_mod(file_path):
+    """Returns the module name and pad count of a .kicad_mod file."""
+    return _parse_kicad_mod_data(Path(file_path).read_bytes())
+
+
+def _parse_kicad_mod_data(data):
+    """Returns the module name and pad count of the bytes of a .kicad_mod
+    file. The byte scanner handles nearly every (module file, KiCad 6+
+    (footprint files go through the S-expression tokenizer and anything
+    else through the pyparsing grammar."""
+    found = _scan_kicad_mod(data)
+    if found is None:
+        if _FOOTPRINT_HEADER.match(data):
+            return _scan_footprint(io.StringIO(data.decode("utf-8")))
+        return _parse_kicad_mod_pyparsing(data.decode("utf-8"))
+    return found
+
+
+def _parse_kicad_mod_pyparsing(text):
+    module_toks = _kicad_mod_parser.parseString(text)
 
     return module_toks.name, len(module_toks.pads)
 
+
+## The byte scanner gives the same answers as the grammar above, quirks
+## included: the whitespace after the name is skipped before the rest of
+## the header line is dropped (so "(module X" on a line of its own eats
+## the next line), only the first unbroken run of pad lines is counted and
+## pads without a number such as (pad "" np_thru_hole ...) are matched
+## but not counted.
+_WS = rb"[ \t\r\n]*"
+_NOT_IDENT = rb"(?![A-Za-z0-9_$])"
+_MODULE_HEADER = re.compile(
+    _WS + rb"\(" + _WS + rb"module" + _NOT_IDENT + _WS + rb'"?' + _WS
+    + rb"([!-~]+)" + _WS + rb'"?[^\r\n]*',
+    re.IGNORECASE,
+)
+_PAD = rb"\(" + _WS + rb"pad" + _NOT_IDENT + _WS + rb'(?:([0-9])|")[^\r\n]*'
+_FIRST_PAD = re.compile(_PAD, re.IGNORECASE)
+_NEXT_PAD = re.compile(_WS + _PAD, re.IGNORECASE)
+
+
+def _scan_kicad_mod(data):
+    """Returns the (name, pad_count) of the footprint in data, the bytes
+    of a .kicad_mod file, or None if it doesn't start with a module
+    header."""
+    header = _MODULE_HEADER.match(data)
+    if header is None:
+        return None
+    name = header.group(1).decode("ascii")
+
+    num_pads = 0
+    pad = _FIRST_PAD.search(data, header.end())
+    while pad is not None:
+        if pad.group(1) is not None:
+            num_pads += 1
+        pad = _NEXT_PAD.match(data, pad.end())
+
+    return name, num_pads
+
+
+_FOOTPRINT_HEADER = re.compile(_WS + rb"\(" + _WS + rb"footprint" + _NOT_IDENT)
+
+
+def _scan_footprint(s_file):
+    """Returns the (name, pad_count) of a KiCad 6+ footprint read from the
+    text file s_file. Every pad directly inside the footprint that has a
+    number is counted, unnumbered pads such as (pad "" np_thru_hole ...)
+    aren't. Raises ValueError if it isn't a footprint."""
+    name = None
+    num_pads = 0
+    for depth, head, args in lists(s_file):
+        if depth == 1:
+            if head not in ("footprint", "module") or not args:
+                raise ValueError(f"Not a footprint, it starts with ({head}")
+            name = args[0]
+        elif depth == 2 and head == "pad" and args and args[0] != "":
+            num_pads += 1
+    if name is None:
+        raise ValueError("Not a footprint")
+    return name, num_pads
+
+
+def _scanner_and_grammar(data):
+    """Returns the (name, pad_count) the byte scanner and the pyparsing
+    grammar each give for the bytes of a (module file, None for either
+    that rejects it. Returns None for a KiCad 6+ (footprint file, those
+    go through _scan_footprint and the grammar can't read them."""
+    if _FOOTPRINT_HEADER.match(data):
+        return None
+    scanned = _scan_kicad_mod(data)
+    try:
+        parsed = _parse_kicad_mod_pyparsing(data.decode("utf-8"))
+        parsed = (str(parsed[0]), parsed[1])
+    except (ParseException, UnicodeDecodeError):
+        parsed = None
+    return scanned, parsed
+
+
+def check_footprint_scanner(footprint_file_dir):
+    """Runs the byte scanner and the pyparsing grammar over every
+    .kicad_mod file below footprint_file_dir and returns the files where
+    the name or pad count differ. Mismatches are also logged. KiCad 6+
+    (footprint files are skipped and counted separately."""
+    file_path = Path(footprint_file_dir)
+    assert file_path.exists() and file_path.is_dir()
+    mismatches = []
+    skipped = 0
+    mod_list = sorted(file_path.glob("**/*.kicad_mod"))
+    for k_mod_file in mod_list:
+        found = _scanner_and_grammar(k_mod_file.read_bytes())
+        if found is None:
+            skipped += 1
+            continue
+        scanned, parsed = found
+        if scanned != parsed:
+            logging.error(
+                f"Scanner mismatch for {k_mod_file}: scanner {scanned} pyparsing {parsed}"
+            )
+            mismatches.append((k_mod_file, scanned, parsed))
+
+    print(
+        f"Checked {len(mod_list) - skipped} footprints, {len(mismatches)}"
+        f" mismatches, skipped {skipped} (footprint files."
+    )
+    return mismatches
+
 if __name__ == "__main__":
     ### Change the path ("D:\APPS\KiCad\share\kicad\modules") to the path to the
     ### kicad modules on your system e.g.  "/usr/share/kicad/modules" or "C:\Program Files\KiCad\share\kicad\modules"
     ### indexing will take 5-10 minutes. Long enough for you to
     ### feel life is slipping away if you watch. 
-    #create_footprint_index("/usr/share/kicad/modules")
-    create_footprint_index("D:\APPS\KiCad\share\kicad\modules")
+    ### workers=os.cpu_count() spreads the parsing over all the cores.
+    #create_footprint_index("/usr/share/kicad/modules", workers=os.cpu_count())
+    ### if a KiCad project has an fp-info-cache the index can be built
+    ### from it in a second, only libraries the cache is out of date for
+    ### are parsed.
+    #create_footprint_index_from_cache("/usr/share/kicad/modules", "fp-info-cache")
+    create_footprint_index("D:\APPS\KiCad\share\kicad\modules", workers=os.cpu_count())
     
@@ -0,0 +1,89 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## The manifest records the path, size, mtime and content hash of every
+## file that went into an index so a re-index only parses what changed.
+
+import hashlib
+import json
+from pathlib import Path
+
+
+def load_manifest(manifest_file, root):
+    """Returns the {relative path: record} dict stored in manifest_file.
+    An empty dict is returned if there is no manifest or it was made
+    for another library directory, which forces a full re-index."""
+    manifest_path = Path(manifest_file)
+    if not manifest_path.is_file():
+        return {}
+    with open(manifest_path, "r", encoding="UTF-8") as m_file:
+        manifest = json.load(m_file)
+    if manifest.get("root") != str(root):
+        return {}
+    return manifest.get("files", {})
+
+
+def save_manifest(manifest_file, root, records):
+    manifest = {"root": str(root), "files": records}
+    with open(manifest_file, "w", encoding="UTF-8") as m_file:
+        json.dump(manifest, m_file, indent=1, sort_keys=True)
+
+
+def file_hash(file_path):
+    sha = hashlib.sha1()
+    with open(file_path, "rb") as h_file:
+        for block in iter(lambda: h_file.read(1 << 16), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def relative_name(file_path, root):
+    return Path(file_path).relative_to(root).as_posix()
+
+
+def check_files(root, files, old_records):
+    """Compares files against the old manifest records.
+    Returns (records, changed) where records is the manifest for files and
+    changed is the list of files that were added or modified. A file is
+    only hashed when its size or mtime differ from the manifest."""
+    records = {}
+    changed = []
+    for f in files:
+        stat = Path(f).stat()
+        rel = relative_name(f, root)
+        record = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        old = old_records.get(rel)
+        if (
+            old is not None
+            and old["size"] == record["size"]
+            and old["mtime"] == record["mtime"]
+        ):
+            record["sha1"] = old["sha1"]
+        else:
+            record["sha1"] = file_hash(f)
+            if old is None or old["sha1"] != record["sha1"]:
+                changed.append(f)
+        records[rel] = record
+
+    return records, changed
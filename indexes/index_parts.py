@@ -26,9 +26,24 @@ from pyparsing import *
 
 import pandas as pd
 from pathlib import Path
+from multiprocessing import Pool
+from contextlib import nullcontext
+import io
 import logging
+import os
 import re
 
+from index_archive import archive_members, is_archive, member_record
+from index_columns import write_columns
+from index_sexpr import lists
+from index_stats import make_stats, phase
+from index_manifest import (
+    check_files,
+    load_manifest,
+    relative_name,
+    save_manifest,
+)
+
 logging.basicConfig(filename="part_index.log", level=logging.DEBUG)
 
 
@@ -130,49 +145,404 @@ def _parse_kicad_lib(text):
     return lib.parseString(text)
 
 
-def _create_index(parsed_lib, lib_file_name):
+def _scan_kicad_lib(text):
+    """Returns a list of (name, aliases, pin_count) tuples for the parts in
+    a KiCad symbol library by walking its DEF/ALIAS/X/ENDDEF lines.
+    Returns None for anything it doesn't understand so the caller can fall
+    back to the full parser."""
+    lines = iter(text.splitlines())
+    for line in lines:
+        if line.startswith("#") or not line.strip():
+            continue
+        if not line.upper().startswith("EESCHEMA-LIBRARY"):
+            return None
+        break
+    else:
+        return None
+
+    parts = []
+    name = None
+    section = None
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        tokens = line.split()
+        if not tokens:
+            continue
+        key = tokens[0].upper()
+        if name is None:
+            # between parts only a DEF is allowed.
+            if key != "DEF" or len(tokens) < 3 or '"' in tokens[1]:
+                return None
+            name, aliases, pin_count = tokens[1], [], 0
+        elif section == "$FPLIST":
+            # footprint filters can look like anything, even X lines.
+            if key == "$ENDFPLIST":
+                section = None
+        elif section == "DRAW":
+            if key == "X":
+                if len(tokens) < 12:
+                    return None
+                pin_count += 1
+            elif key == "ENDDRAW":
+                section = None
+        elif key == "ALIAS":
+            aliases.extend(tokens[1:])
+        elif key in ("$FPLIST", "DRAW"):
+            section = key
+        elif key == "ENDDEF":
+            parts.append((name, aliases, pin_count))
+            name = None
+
+    if name is not None:
+        # ran out of file inside a DEF.
+        return None
+
+    return parts
+
+
+def _lib_parts(text):
+    """Returns the (name, aliases, pin_count) of each part in a library,
+    using the line scanner and falling back to the pyparsing grammar."""
+    parts = _scan_kicad_lib(text)
+    if parts is None:
+        parsed_lib = _parse_kicad_lib(text)
+        parts = [
+            (part.name, list(part.alias_p), len(part.pins))
+            for part in parsed_lib.parts
+        ]
+
+    return parts
+
+
+def _create_index(lib_parts, lib_file_name):
     """Creates a dataframe that will provide an index based on pin count"""
 
     p_dict = {"part_name": [], "pin_count": [], "location": [], "alias": []}
 
-    for part in parsed_lib.parts:
-        p_dict["part_name"].append(part.name)
-        p_dict["pin_count"].append(len(part.pins))
+    for name, aliases, pin_count in lib_parts:
+        p_dict["part_name"].append(name)
+        p_dict["pin_count"].append(pin_count)
         p_dict["location"].append(lib_file_name)
-        p_dict["alias"].append(part.name)
-        for p in part.alias_p:
+        p_dict["alias"].append(name)
+        for p in aliases:
             p_dict["part_name"].append(p)
-            p_dict["pin_count"].append(len(part.pins))
+            p_dict["pin_count"].append(pin_count)
             p_dict["location"].append(lib_file_name)
-            p_dict["alias"].append(part.name)
+            p_dict["alias"].append(name)
 
     return p_dict
 
 
-def create_part_index(part_file_dir):
+def _split_defs(text):
+    """Splits the text of a library into its header and a list of
+    (line number, text) for each DEF ... ENDDEF block. A DEF missing its
+    ENDDEF ends at the next DEF so it can only spoil itself."""
+    header = []
+    blocks = []
+    block = None
+    for line_no, line in enumerate(text.splitlines(), 1):
+        tokens = line.split(None, 1)
+        key = tokens[0].upper() if tokens else ""
+        if key == "DEF":
+            if block is not None:
+                blocks.append(block)
+            block = (line_no, [line])
+        elif block is not None:
+            block[1].append(line)
+            if key == "ENDDEF":
+                blocks.append(block)
+                block = None
+        elif not blocks:
+            header.append(line)
+    if block is not None:
+        blocks.append(block)
+
+    header = "\n".join(header) + "\n"
+    return header, [(line_no, "\n".join(b) + "\n") for line_no, b in blocks]
+
+
+def _parse_def_block(def_block):
+    """Parses one (header, line number, text) DEF block, runs in the pool
+    workers so a parse error is returned rather than raised."""
+    header, line_no, text = def_block
+    try:
+        return line_no, _lib_parts(header + text), None
+    except ParseBaseException as e:
+        return line_no, None, str(e)
+
+
+def _index_lib(k_lib_file, pool, chunksize, text=None):
+    """Returns the index dict for one library and whether every DEF in
+    it parsed. Libraries with more than chunksize DEFs are parsed in the
+    pool, the parts keep their order in the file. text is the library
+    when it has already been read, from an archive say."""
+    if text is None:
+        with open(k_lib_file, "r", encoding="UTF-8") as lib:
+            text = lib.read()
+    header, blocks = _split_defs(text)
+    def_blocks = [(header, line_no, text) for line_no, text in blocks]
+    if pool is not None and len(def_blocks) > chunksize:
+        results = pool.imap(_parse_def_block, def_blocks, chunksize=chunksize)
+    else:
+        results = map(_parse_def_block, def_blocks)
+
+    lib_parts = []
+    all_parsed = True
+    for line_no, parts, error in results:
+        if parts is None:
+            logging.error(
+                f"Parse Error in the DEF at line {line_no} of {k_lib_file}: {error}"
+            )
+            all_parsed = False
+            continue
+        lib_parts.extend(parts)
+
+    return _create_index(lib_parts, k_lib_file), all_parsed
+
+
+def _scan_kicad_sym(s_file):
+    """Returns (parts, missing) for a KiCad 6+ .kicad_sym library read from
+    the text file s_file. parts is a list of (name, aliases, pin_count)
+    tuples, as _scan_kicad_lib gives, for the top level symbols. A symbol
+    that extends another is listed as an alias of the symbol it derives
+    from and gets its pin count. missing lists the symbols that extend a
+    symbol that isn't in the file. Raises ValueError if s_file isn't a
+    symbol library."""
+    # name: [extends, pin count], in file order.
+    symbols = {}
+    name = None
+    is_lib = False
+    for depth, head, args in lists(s_file):
+        if depth == 1:
+            if head != "kicad_symbol_lib":
+                raise ValueError(f"Not a symbol library, it starts with ({head}")
+            is_lib = True
+        elif depth == 2:
+            name = args[0] if head == "symbol" and args else None
+            if name is not None:
+                symbols[name] = [None, 0]
+        elif name is None:
+            continue
+        elif depth == 3 and head == "extends" and args:
+            symbols[name][0] = args[0]
+        elif head == "pin":
+            # pins sit in the unit symbols nested inside the symbol.
+            symbols[name][1] += 1
+    if not is_lib:
+        raise ValueError("Not a symbol library")
+
+    aliases = {n: [] for n, (extends, _) in symbols.items() if extends is None}
+    missing = []
+    for n, (extends, _) in symbols.items():
+        root = n
+        seen = set()
+        while root in symbols and symbols[root][0] is not None and root not in seen:
+            seen.add(root)
+            root = symbols[root][0]
+        if root not in aliases:
+            missing.append(n)
+        elif root != n:
+            aliases[root].append(n)
+
+    return [(n, aliases[n], symbols[n][1]) for n in aliases], missing
+
+
+def _index_kicad_sym(k_lib_file, s_file=None):
+    """Returns the index dict for one .kicad_sym library and whether every
+    symbol in it could be indexed. The file is streamed, never held in
+    memory whole. s_file is an already open text file to read instead of
+    k_lib_file."""
+    if s_file is None:
+        s_file = open(k_lib_file, "r", encoding="UTF-8")
+    try:
+        with s_file as lib:
+            lib_parts, missing = _scan_kicad_sym(lib)
+    except ValueError as e:
+        logging.error(f"Parse Error in {k_lib_file}: {e}")
+        return None, False
+    for name in missing:
+        logging.error(f"{name} in {k_lib_file} extends a symbol that isn't there")
+
+    return _create_index(lib_parts, k_lib_file), not missing
+
+
+def create_part_index(
+    part_file_dir, incremental=True, workers=1, chunksize=64, stats=None
+):
+    """Index every .lib and .kicad_sym file in part_file_dir.
+    part_file_dir can also be a .zip or .tar.* bundle, every library in
+    it is indexed as it is read without unpacking it. A bundle is always
+    indexed in full, its location column holds each library's path
+    inside the bundle.
+    incremental=True only parses the libraries added or changed since the
+    manifest was written, rows for deleted libraries are dropped.
+    Each library is split into its DEF blocks, workers > 1 parses the
+    blocks of libraries with more than chunksize parts in a process pool.
+    A DEF that fails to parse is logged and skipped.
+    stats=True (or an index_stats.Stats) records how long each phase took
+    and what was read, the Stats is returned."""
+    stats = make_stats(stats, "Part index")
     file_path = Path(part_file_dir)
+    assert isinstance(workers, int) and workers > 0
+    if is_archive(file_path) and file_path.is_file():
+        return _create_part_index_from_archive(file_path, workers, chunksize, stats)
     assert file_path.exists() and file_path.is_dir()
-    lib_list = file_path.glob("*.lib")
-    # print(list(mod_list))
 
     print(f"Starting indexing of directory:{file_path}")
-    index_df = pd.DataFrame(
-        {"part_name": [], "pin_count": [], "location": [], "alias": []}
-    )
-    for k_lib_file in lib_list:
-        print(k_lib_file)
-        with open(k_lib_file, "r", encoding="UTF-8") as lib:
+    with phase(stats, "find files"):
+        lib_list = sorted(
+            list(file_path.glob("*.lib")) + list(file_path.glob("*.kicad_sym"))
+        )
+        old_records = {}
+        if incremental and Path("skidl_part_index.csv").is_file():
+            old_records = load_manifest("skidl_part_manifest.json", file_path)
+        records, changed = check_files(file_path, lib_list, old_records)
+    print(f"{len(changed)} of {len(lib_list)} library files to parse.")
+    if stats is not None:
+        stats.count("files found", len(lib_list))
+        stats.count("files parsed", len(changed))
+
+    # The old index is read _OLD_ROWS rows at a time alongside lib_list,
+    # its libraries are in the same order. Rows are appended to the csv one
+    # library at a time, so only one library and one chunk of the old index
+    # are ever held in memory. The index is written to a temporary file
+    # first so a failed run leaves the old index intact.
+    old_libs = iter(())
+    if old_records:
+        old_libs = _old_libraries("skidl_part_index.csv")
+    with phase(stats, "read old index"):
+        old_lib = next(old_libs, None)
+    lib_order = {str(k_lib_file): i for i, k_lib_file in enumerate(lib_list)}
+    changed = set(changed)
+    with open(
+        "skidl_part_index.csv.tmp", "w", encoding="UTF-8", newline=""
+    ) as index_file, (
+        Pool(processes=workers) if workers > 1 else nullcontext()
+    ) as pool:
+        index_file.write("part_name,pin_count,location,alias\n")
+        for i, k_lib_file in enumerate(lib_list):
+            if k_lib_file not in changed:
+                # skip the rows of deleted libraries on the way.
+                found = False
+                while old_lib is not None and lib_order.get(old_lib[0], -1) <= i:
+                    if lib_order.get(old_lib[0]) == i:
+                        found = True
+                        with phase(stats, "write"):
+                            old_lib[1].to_csv(index_file, header=False, index=False)
+                        if stats is not None:
+                            stats.count("rows", len(old_lib[1]))
+                    with phase(stats, "read old index"):
+                        old_lib = next(old_libs, None)
+                if found:
+                    continue
+                # no rows where they should be, parse it again.
+            print(k_lib_file)
+            if stats is not None:
+                stats.read(
+                    relative_name(k_lib_file, file_path),
+                    k_lib_file.stat().st_size,
+                )
             try:
-                parsed_lib = _parse_kicad_lib(lib.read())
-                parts = _create_index(parsed_lib, k_lib_file)
-                k_lib_df = pd.DataFrame(parts)
-                index_df = pd.concat([index_df, k_lib_df])
-            except:
-                logging.error(f"Parse Error when parsing {k_lib_file}")
+                with phase(stats, "parse"):
+                    if k_lib_file.suffix == ".kicad_sym":
+                        parts, all_parsed = _index_kicad_sym(k_lib_file)
+                    else:
+                        parts, all_parsed = _index_lib(k_lib_file, pool, chunksize)
+            except (OSError, UnicodeDecodeError) as e:
+                logging.error(f"Error when reading {k_lib_file}: {e}")
+                parts, all_parsed = None, False
+            if parts is not None:
+                with phase(stats, "write"):
+                    k_lib_df = pd.DataFrame(parts)
+                    k_lib_df.to_csv(index_file, header=False, index=False)
+                if stats is not None:
+                    stats.count("rows", len(k_lib_df))
+            if not all_parsed:
+                if stats is not None:
+                    stats.count("files with errors")
+                # leave it out of the manifest so it is tried again next time.
+                del records[relative_name(k_lib_file, file_path)]
+
+    os.replace("skidl_part_index.csv.tmp", "skidl_part_index.csv")
+    with phase(stats, "write"):
+        write_columns("skidl_part_index.csv")
+        save_manifest("skidl_part_manifest.json", file_path, records)
+
+    print(f"Completed index, see part_index.log for any errors.")
+    return stats
 
-    index_df.to_csv("skidl_part_index.csv")
+
+## Rows of the old index read at a time by an incremental run.
+_OLD_ROWS = 10000
+
+
+def _old_libraries(index_csv):
+    """Yields (location, rows) for each run of rows from one library in
+    index_csv, reading _OLD_ROWS rows at a time. A library split across
+    two reads comes out as two runs."""
+    # usecols drops the index column older versions wrote.
+    chunks = pd.read_csv(
+        index_csv,
+        usecols=["part_name", "pin_count", "location", "alias"],
+        dtype={"part_name": str, "location": str, "alias": str},
+        keep_default_na=False,
+        chunksize=_OLD_ROWS,
+    )
+    for chunk in chunks:
+        locations = chunk.location.tolist()
+        start = 0
+        for end in range(1, len(locations) + 1):
+            if end == len(locations) or locations[end] != locations[start]:
+                yield locations[start], chunk.iloc[start:end]
+                start = end
+
+
+def _create_part_index_from_archive(archive_path, workers, chunksize, stats):
+    print(f"Starting indexing of archive:{archive_path}")
+    records = {}
+    # only the rows are kept, not the libraries, so they can be written in
+    # file order whatever order the members are stored in.
+    lib_dfs = {}
+    with (Pool(processes=workers) if workers > 1 else nullcontext()) as pool:
+        for name, data in archive_members(archive_path, (".lib", ".kicad_sym")):
+            print(name)
+            if stats is not None:
+                stats.count("files found")
+                stats.count("files parsed")
+                stats.read(name, len(data))
+            try:
+                with phase(stats, "parse"):
+                    text = data.decode("UTF-8")
+                    if name.endswith(".kicad_sym"):
+                        parts, all_parsed = _index_kicad_sym(name, io.StringIO(text))
+                    else:
+                        parts, all_parsed = _index_lib(name, pool, chunksize, text)
+            except UnicodeDecodeError as e:
+                logging.error(f"Error when reading {name} in {archive_path}: {e}")
+                parts, all_parsed = None, False
+            if parts is not None:
+                lib_dfs[name] = pd.DataFrame(parts)
+            if all_parsed:
+                records[name] = member_record(data)
+            elif stats is not None:
+                stats.count("files with errors")
+
+    with phase(stats, "write"):
+        with open(
+            "skidl_part_index.csv.tmp", "w", encoding="UTF-8", newline=""
+        ) as index_file:
+            index_file.write("part_name,pin_count,location,alias\n")
+            for name in sorted(lib_dfs):
+                lib_dfs[name].to_csv(index_file, header=False, index=False)
+                if stats is not None:
+                    stats.count("rows", len(lib_dfs[name]))
+        os.replace("skidl_part_index.csv.tmp", "skidl_part_index.csv")
+        write_columns("skidl_part_index.csv")
+        save_manifest("skidl_part_manifest.json", archive_path, records)
 
     print(f"Completed index, see part_index.log for any errors.")
+    return stats
 
 
 # main entrypoint.
@@ -181,5 +551,6 @@ if __name__ == "__main__":
     ### kicad library on your system e.g. "/usr/share/kicad/library" or "C:\Program Files\KiCad\share\kicad\library"
     ### indexing will take 5-10 minutes. Long enough for you to
     ### feel life is slipping away if you watch.
-#     create_part_index("/usr/share/kicad/library")
-    create_part_index("D:\APPS\KiCad\share\kicad\library")
+    ### workers=os.cpu_count() parses the DEFs of the big libraries on all the cores.
+#     create_part_index("/usr/share/kicad/library", workers=os.cpu_count())
+    create_part_index("D:\APPS\KiCad\share\kicad\library", workers=os.cpu_count())
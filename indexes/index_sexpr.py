@@ -0,0 +1,104 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## A streaming tokenizer for the S-expression files KiCad 6 and later
+## write (.kicad_sym symbol libraries and .kicad_mod footprints that start
+## with "(footprint"). The file is read a block at a time and turned into
+## a flat run of tokens, no tree is built so memory use doesn't grow with
+## the size of the file. Callers keep what they need as they go.
+
+import re
+
+## Token kinds. An ATOM's value is the bare word or the unescaped text of
+## a quoted string, so a quoted "(" is an ATOM not an OPEN.
+OPEN, CLOSE, ATOM = 0, 1, 2
+
+_TOKEN = re.compile(
+    r'[ \t\r\n]*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^ \t\r\n()"]+))', re.DOTALL
+)
+_ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+
+
+def tokens(s_file, block_size=1 << 16):
+    """Yields (kind, value) for each token read from the text file
+    s_file. value is None for OPEN and CLOSE. Raises ValueError at the end
+    of the file if a quoted string is never closed."""
+    text = ""
+    pos = 0
+    at_end = False
+    while True:
+        token = _TOKEN.match(text, pos)
+        if token is None or (token.end() == len(text) and not at_end):
+            # the token may carry on in the next block.
+            if at_end:
+                if text[pos:].strip():
+                    raise ValueError(f"Can't tokenize: {text[pos:pos + 40]!r}")
+                return
+            block = s_file.read(block_size)
+            text = text[pos:] + block
+            pos = 0
+            at_end = not block
+            continue
+        pos = token.end()
+        if token.group(1) is not None:
+            yield OPEN, None
+        elif token.group(2) is not None:
+            yield CLOSE, None
+        elif token.group(4) is not None:
+            yield ATOM, token.group(4)
+        else:
+            value = token.group(3)
+            if "\\" in value:
+                value = _ESCAPE.sub(r"\1", value)
+            yield ATOM, value
+
+
+def lists(s_file):
+    """Yields (depth, head, args) for the start of every list in s_file:
+    depth is 1 for the outermost list, head the atom that opens it and
+    args the atoms that directly follow the head, up to the first nested
+    list or the end of the list."""
+    depth = 0
+    head = None
+    args = None
+    for kind, value in tokens(s_file):
+        if kind == ATOM:
+            if head is None:
+                head = value
+            elif args is not None:
+                args.append(value)
+            continue
+        if head is not None and args is not None:
+            yield depth, head, args
+        head = None
+        args = None
+        if kind == OPEN:
+            depth += 1
+            args = []
+        else:
+            depth -= 1
+            if depth < 0:
+                raise ValueError("Unbalanced )")
+    if depth != 0:
+        raise ValueError("Ran out of file inside a list")
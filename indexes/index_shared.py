@@ -0,0 +1,165 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## Index columns published once into a multiprocessing.shared_memory
+## segment, so every process in a pool can search the one copy. Count
+## columns are stored as they are. Text columns are stored as a string
+## table: the UTF-8 bytes of every value back to back, plus an int64 array
+## of the offset each value starts at, with one more for the end. A text
+## column with few distinct values (the library locations) is stored as a
+## string table of those values plus the integer code of each row.
+## Attaching wraps numpy arrays round the segment, nothing is copied.
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_ALIGN = 8
+
+
+def encode_strings(values):
+    """Returns the (offsets, data) string table of values."""
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+class StringTable(object):
+    """The strings of a string table, each one decoded when it is asked
+    for. Indexing with a row number gives a str, with an array of row
+    numbers a list of them."""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self._data = memoryview(data)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, rows):
+        offsets = self.offsets
+        data = self._data
+        if isinstance(rows, (int, np.integer)):
+            return str(data[offsets[rows] : offsets[rows + 1]], "utf-8")
+        return [str(data[offsets[r] : offsets[r + 1]], "utf-8") for r in rows]
+
+    def __iter__(self):
+        return iter(self[range(len(self))])
+
+
+class CodedStrings(object):
+    """The strings of a coded column: row r is table[codes[r]]. Indexed
+    like a StringTable."""
+
+    def __init__(self, codes, table):
+        self.codes = codes
+        self.table = table
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, rows):
+        if isinstance(rows, (int, np.integer)):
+            return self.table[int(self.codes[rows])]
+        return self.table[self.codes[rows]]
+
+    def __iter__(self):
+        return iter(self[range(len(self))])
+
+
+class SharedArrays(object):
+    """Named numpy arrays copied into one shared memory segment. Pickling
+    it (handing it to a pool worker, say) only sends the segment name and
+    layout, the worker maps the segment when it asks for the arrays.
+    The process that made it unlinks the segment with unlink(), or by
+    leaving a with block, once the workers are finished with it."""
+
+    def __init__(self, arrays):
+        self.layout = {}
+        size = 0
+        for name, values in arrays.items():
+            values = np.ascontiguousarray(values)
+            size = -(-size // _ALIGN) * _ALIGN
+            self.layout[name] = (values.dtype.str, size, values.shape)
+            size += values.nbytes
+        # a segment can't be empty.
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.name = self._shm.name
+        self.size = size
+        self._owner = True
+        for name, view in self._views().items():
+            view[...] = arrays[name]
+
+    def __getstate__(self):
+        return {"name": self.name, "size": self.size, "layout": self.layout}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = None
+        self._owner = False
+
+    def _views(self):
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        return {
+            name: np.ndarray(shape, dtype, buffer=self._shm.buf, offset=offset)
+            for name, (dtype, offset, shape) in self.layout.items()
+        }
+
+    def arrays(self):
+        """Returns {name: read only array} mapped from the segment."""
+        views = self._views()
+        for view in views.values():
+            view.flags.writeable = False
+        return views
+
+    def close(self):
+        """Unmaps the segment, if no arrays from it are still in use."""
+        if self._shm is None:
+            return
+        try:
+            self._shm.close()
+        except BufferError:
+            # arrays still point into it, it goes when they do.
+            return
+        self._shm = None
+
+    def unlink(self):
+        """Frees the segment once every process has let go of it. Only the
+        process that made it can unlink it."""
+        assert self._owner
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        self._shm.unlink()
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._owner:
+            self.unlink()
+        else:
+            self.close()
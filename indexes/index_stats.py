@@ -0,0 +1,137 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## Opt-in instrumentation for the indexers and SearchPart. A Stats records
+## how long each phase took and how often it ran, named counters (rows
+## scanned, rows matched...) and the bytes read from each parsed file.
+## Code that is instrumented holds None when it is turned off and only
+## checks for None, so there is next to nothing to pay. The summaries are
+## printed at exit by one hook for the Stats still in use, _at_exit only
+## holds weak references so a Stats goes with whatever made it.
+
+import atexit
+import time
+import weakref
+from collections import defaultdict
+from contextlib import nullcontext
+
+_NO_PHASE = nullcontext()
+_at_exit = weakref.WeakSet()
+
+
+@atexit.register
+def _print_summaries():
+    for stats in sorted(_at_exit, key=lambda s: s.created):
+        stats.print_summary()
+
+
+class _Phase(object):
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        timing = self.stats.phases[self.name]
+        timing[0] += 1
+        timing[1] += time.perf_counter() - self.start
+
+
+class Stats(object):
+    def __init__(self, name, summary_at_exit=True):
+        self.name = name
+        self.phases = defaultdict(lambda: [0, 0.0])
+        self.counts = defaultdict(int)
+        self.files = {}
+        self.created = time.perf_counter()
+        if summary_at_exit:
+            _at_exit.add(self)
+
+    def phase(self, name):
+        """A context that times a run of the named phase."""
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def read(self, file_name, n_bytes):
+        """Records that file_name, n_bytes long, was read and parsed."""
+        self.files[str(file_name)] = n_bytes
+
+    def as_dict(self):
+        return {
+            "phases": {
+                name: {"calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in self.phases.items()
+            },
+            "counts": dict(self.counts),
+            "bytes_read": {
+                "files": len(self.files),
+                "total": sum(self.files.values()),
+                "per_file": dict(self.files),
+            },
+        }
+
+    def summary(self):
+        lines = [f"{self.name} stats:"]
+        for name, (calls, seconds) in self.phases.items():
+            lines.append(
+                f"  {name:24s} {calls:8d} calls {seconds * 1e3:12.2f} ms"
+                f" {seconds / calls * 1e6:10.1f} us/call"
+            )
+        for name, n in self.counts.items():
+            lines.append(f"  {name:24s} {n:8d}")
+        if self.files:
+            total = sum(self.files.values())
+            lines.append(
+                f"  {'bytes read':24s} {total:8d} from {len(self.files)} files,"
+                f" {total // len(self.files)} per file"
+            )
+            largest = sorted(self.files.items(), key=lambda f: f[1], reverse=True)
+            for file_name, n_bytes in largest[:3]:
+                lines.append(f"    {n_bytes:10d} {file_name}")
+        return "\n".join(lines)
+
+    def print_summary(self):
+        if self.phases or self.counts or self.files:
+            print(self.summary())
+
+
+def phase(stats, name):
+    """stats.phase(name), or a context that does nothing when stats is
+    None."""
+    return _NO_PHASE if stats is None else stats.phase(name)
+
+
+def make_stats(stats, name):
+    """Turns the stats argument of an instrumented function into a Stats
+    or None: True makes a new Stats that prints its summary at exit if it
+    is still held then, a Stats is used as it is."""
+    if stats is True:
+        return Stats(name)
+    return stats or None
@@ -0,0 +1,233 @@
+# MIT license
+#
+# Copyright (c) Dave Humphries 2020
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+## Additionally this software is ropey and only intended as proof of concept.
+
+## Search engines for the part and footprint names. Each one takes the row
+## positions left after the pin or pad count lookup and a compiled name
+## regex, and returns the positions of the rows whose name the regex
+## searches successfully, in row order. They must give exactly the rows
+## that regex.search over every name would. The first_ functions stop at
+## the first such row and return it, or None.
+
+import re
+from bisect import bisect_right
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # before Python 3.11
+    import sre_parse
+
+
+def scan_search(names, rows, regex):
+    """Runs the regex over the name of every row."""
+    found = [regex.search(n) is not None for n in names[rows]]
+    return rows[np.array(found, dtype=bool)]
+
+
+def scan_first(names, rows, regex):
+    for row in rows:
+        if regex.search(names[row]) is not None:
+            return int(row)
+    return None
+
+
+def required_literals(regex):
+    """Returns the runs of plain ASCII characters, lower cased, that every
+    match of regex has to contain. Only the top level of the pattern is
+    looked at: anything other than a literal character (a class, a
+    repeat, a group, an alternative...) ends the current run."""
+    runs = []
+    run = []
+    for op, av in sre_parse.parse(regex.pattern, regex.flags):
+        if op == sre_parse.LITERAL and av < 128:
+            run.append(chr(av).lower())
+            continue
+        if run:
+            runs.append("".join(run))
+        run = []
+    if run:
+        runs.append("".join(run))
+    return runs
+
+
+class TrigramIndex(object):
+    """An inverted index from each three character slice of the lower cased
+    names to the rows holding it. Names with non-ASCII characters are
+    always handed to the regex since case folding could make them match in
+    ways lower() doesn't show."""
+
+    def __init__(self, names):
+        postings = defaultdict(list)
+        always = []
+        for row, name in enumerate(names):
+            if not name.isascii():
+                always.append(row)
+                continue
+            low = name.lower()
+            for gram in {low[i : i + 3] for i in range(len(low) - 2)}:
+                postings[gram].append(row)
+        self.postings = {
+            gram: np.array(p_rows, dtype=np.intp) for gram, p_rows in postings.items()
+        }
+        self.always = np.array(always, dtype=np.intp)
+
+    def candidates(self, rows, regex):
+        """Returns the rows that could match regex, or rows unchanged if the
+        pattern has no literal run of three or more characters."""
+        grams = set()
+        for literal in required_literals(regex):
+            grams.update(literal[i : i + 3] for i in range(len(literal) - 2))
+        if not grams:
+            return rows
+        # shortest posting list first so the intersections stay small.
+        postings = sorted(
+            (self.postings.get(gram, np.empty(0, dtype=np.intp)) for gram in grams),
+            key=len,
+        )
+        found = rows
+        for p_rows in postings:
+            found = np.intersect1d(found, p_rows, assume_unique=True)
+            if len(found) == 0:
+                break
+        always = np.intersect1d(rows, self.always, assume_unique=True)
+        return np.union1d(found, always)
+
+    def search(self, names, rows, regex):
+        return scan_search(names, self.candidates(rows, regex), regex)
+
+    def first(self, names, rows, regex):
+        return scan_first(names, self.candidates(rows, regex), regex)
+
+
+## Positions that mean something different inside the blob than at the ends
+## of a lone name. Patterns using them, or lookarounds which could see the
+## neighbouring names, are always scanned. So are atomic groups and
+## possessive repeats (Python 3.11+): they can run on past the newline into
+## the next name and then fail without backtracking to the match the lone
+## name has.
+_UNSAFE_AT = {
+    sre_parse.AT_BEGINNING_STRING,
+    sre_parse.AT_END_STRING,
+    sre_parse.AT_NON_BOUNDARY,
+}
+_UNSAFE_OPS = {sre_parse.ASSERT, sre_parse.ASSERT_NOT} | {
+    getattr(sre_parse, name)
+    for name in ("ATOMIC_GROUP", "POSSESSIVE_REPEAT")
+    if hasattr(sre_parse, name)
+}
+
+
+def _subpatterns(av):
+    if isinstance(av, sre_parse.SubPattern):
+        yield av
+    elif isinstance(av, (tuple, list)):
+        for item in av:
+            yield from _subpatterns(item)
+
+
+def _blob_safe(parsed):
+    for op, av in parsed:
+        if op in _UNSAFE_OPS:
+            return False
+        if op == sre_parse.AT and av in _UNSAFE_AT:
+            return False
+        for sub in _subpatterns(av):
+            if not _blob_safe(sub):
+                return False
+    return True
+
+
+@lru_cache(maxsize=1024)
+def _blob_regex(pattern, flags):
+    """Returns the regex to run over a blob, or None if the pattern can't
+    be run over one."""
+    if not _blob_safe(sre_parse.parse(pattern, flags)):
+        return None
+    return re.compile(pattern, flags | re.MULTILINE)
+
+
+class NameBlob(object):
+    """The names of some rows joined by newlines into one string, with the
+    offset each name starts at. A search runs the regex in multiline mode
+    along the string, so ^ and $ still match at the ends of each name, and
+    restarts it at the next name after each hit."""
+
+    def __init__(self, names):
+        self.size = len(names)
+        self.text = "\n".join(names)
+        self.starts = []
+        self.ends = []
+        offset = 0
+        for name in names:
+            self.starts.append(offset)
+            offset += len(name)
+            self.ends.append(offset)
+            offset += 1
+        # a newline inside a name would split it.
+        self.usable = not any("\n" in name for name in names)
+
+    def find(self, regex, limit=None):
+        """Returns the positions, within this blob, of the names the regex
+        matches, or None if the answer can't be trusted and the names have
+        to be scanned one at a time. limit stops the search after that many
+        names are found."""
+        b_regex = _blob_regex(regex.pattern, regex.flags)
+        if b_regex is None or not self.usable:
+            return None
+        found = []
+        text, starts, ends = self.text, self.starts, self.ends
+        pos = 0
+        while pos <= len(text) and (not found or found[-1] + 1 < self.size):
+            hit = b_regex.search(text, pos)
+            if hit is None:
+                break
+            name = bisect_right(starts, hit.start()) - 1
+            if hit.end() > ends[name]:
+                # the match ran on into the next name.
+                return None
+            found.append(name)
+            if len(found) == limit:
+                break
+            pos = ends[name] + 1
+        return found
+
+    def search(self, names, rows, regex):
+        """rows are the rows the blob was built from."""
+        if self.size == 0:
+            return rows
+        found = self.find(regex)
+        if found is None:
+            return scan_search(names, rows, regex)
+        return rows[np.array(found, dtype=np.intp)]
+
+    def first(self, names, rows, regex):
+        if self.size == 0:
+            return None
+        found = self.find(regex, limit=1)
+        if found is None:
+            return scan_first(names, rows, regex)
+        return int(rows[found[0]]) if found else None
@@ -23,73 +23,791 @@
 ## Additionally this software is ropey and only intended as proof of concept.
 
 
+## pandas is imported by the functions that make frames rather than here,
+## a script sending its queries to an index server never loads it.
+
 from pyparsing import *
-import pandas as pd
 from pathlib import Path
+import hashlib
+import json
+import os
 import re
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+import numpy as np
 import skidl
 
+from indexes.index_columns import read_columns
+from indexes.index_shared import (
+    CodedStrings,
+    SharedArrays,
+    StringTable,
+    encode_strings,
+)
+from indexes.index_stats import Stats, phase
+from index_server import IndexClient, socket_path
+from name_search import NameBlob, TrigramIndex, scan_first, scan_search
+
+## Loaded indexes are shared by every SearchPart in the process. Entries are
+## keyed by the resolved index file plus its mtime and size, so a changed
+## file gets a new entry and is loaded again. Each entry is an _Index
+## holding a reference count; an entry for an old version of a file is
+## dropped once no SearchPart holds it. The frames are shared so treat
+## them as read only. An index file is read holding only its own entry in
+## _index_loads, not _index_cache_lock, so other threads aren't held up.
+## SearchPart.__del__ can run from the garbage collector at any point,
+## even while this thread holds a lock, so it only queues its keys on
+## _released; they are let go the next time the cache is locked.
+_index_cache = {}
+_index_cache_lock = threading.Lock()
+_index_loads = {}
+_released = deque()
+
+
+## The columns SearchPart reads from each index, anything else in the files
+## (the footprint source column, the unnamed index column older versions
+## wrote) is skipped.
+_PART_COLUMNS = ["part_name", "pin_count", "location", "alias"]
+_FP_COLUMNS = ["name", "pad_count", "location"]
+
+
+def _read_index(csv_path, columns):
+    """Reads the binary column copy of an index csv, the csv is only
+    parsed if the copy is missing or out of date."""
+    import pandas as pd
+
+    index_df = read_columns(csv_path, columns)
+    if index_df is None:
+        text_columns = [c for c in columns if not c.endswith("_count")]
+        index_df = pd.read_csv(
+            csv_path,
+            usecols=columns,
+            dtype=dict.fromkeys(text_columns, str),
+            keep_default_na=False,
+        )
+        # the counts were written as floats by the first versions.
+        count_columns = [c for c in columns if c.endswith("_count")]
+        index_df = index_df.astype(dict.fromkeys(count_columns, "int64"))
+    return _compact_index(index_df[columns])
+
+
+## Loaded indexes are kept compact. The counts are held in the narrowest
+## integer type that fits them. location is a categorical, so each library
+## path is held once and every row has a small integer code. An alias that
+## is the part's own name shares the part_name string. The frames the
+## queries return are widened back to int64 counts and str text.
+_COUNT_DTYPES = (np.int16, np.int32, np.int64)
+
+
+def _compact_index(index_df):
+    import pandas as pd
+
+    compact = {}
+    for column in index_df.columns:
+        values = index_df[column]
+        if column.endswith("_count"):
+            counts = values.to_numpy()
+            low, high = (counts.min(), counts.max()) if len(counts) else (0, 0)
+            dtype = next(
+                d
+                for d in _COUNT_DTYPES
+                if np.iinfo(d).min <= low and high <= np.iinfo(d).max
+            )
+            compact[column] = counts.astype(dtype)
+        elif column == "location":
+            compact[column] = pd.Categorical(values)
+        else:
+            compact[column] = values
+    if "alias" in compact and "part_name" in compact:
+        aliases = [
+            name if alias == name else alias
+            for name, alias in zip(index_df.part_name, index_df.alias)
+        ]
+        compact["alias"] = pd.array(aliases, dtype=index_df.alias.dtype)
+    return pd.DataFrame(compact)
+
+
+def _widen(frame):
+    """frame with the int64 counts and str text of the index files."""
+    return frame.astype(
+        {c: "int64" if c.endswith("_count") else str for c in frame.columns}
+    )
+
+
+def _rows_frame(labels, columns, values):
+    """The data frame of some rows of an index, given their labels and the
+    values of each column."""
+    import pandas as pd
+
+    return _widen(
+        pd.DataFrame(dict(zip(columns, values)), index=labels, columns=columns)
+    )
+
+
+## How the names are searched, every engine gives the same rows.
+## scan: run the regex over each name with the right count.
+## trigram: only run it over the names holding every three character slice
+##     of the literal text in the pattern (built on first use).
+## blob: run the regex once along the names with the right count joined by
+##     newlines (built for each count on first use).
+_ENGINES = ("scan", "trigram", "blob")
+
+## The most recent name searches kept by each loaded index.
+_QUERY_CACHE_SIZE = 1024
+_NO_ROWS = np.empty(0, dtype=np.intp)
+
+
+@lru_cache(maxsize=_QUERY_CACHE_SIZE)
+def _compile_name(name):
+    """The regex a name search runs, upper cased and case insensitive as
+    str.contains(name.upper(), case=False) always did."""
+    return re.compile(name.upper(), re.IGNORECASE)
+
+
+class _QueryCache(object):
+    """A least recently used map of (count, pattern, flags) to the matching
+    row positions, with hit and miss counters."""
+
+    def __init__(self, maxsize=_QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            rows = self._rows.get(key)
+            if rows is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._rows.move_to_end(key)
+            return rows
+
+    def put(self, key, rows):
+        with self._lock:
+            self._rows[key] = rows
+            self._rows.move_to_end(key)
+            while len(self._rows) > self.maxsize:
+                self._rows.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "maxsize": self.maxsize,
+            "currsize": len(self._rows),
+        }
+
+
+def _bucket_order(counts):
+    """Returns (order, values, starts): the row positions sorted by count,
+    in row order within a count, each count and where its rows start in
+    order."""
+    order = np.argsort(counts, kind="stable")
+    values, starts = np.unique(counts[order], return_index=True)
+    return order, values, starts
+
+
+def _count_buckets(order, values, starts):
+    """Maps each pin or pad count to the positions of the rows with that
+    count, in row order. The positions are views into order."""
+    return dict(zip(values.tolist(), np.split(order, starts[1:])))
+
+
+class _Index(object):
+    """A loaded index, its count buckets, the cache of its name searches
+    and the number of SearchParts using it. A reloaded index is a new
+    _Index so its search cache starts empty."""
+
+    def __init__(self, index_df, name_column, count_column):
+        self.df = index_df
+        self._init_search(
+            index_df[name_column].to_numpy(dtype=object),
+            _count_buckets(*_bucket_order(index_df[count_column].to_numpy())),
+        )
+
+    def _init_search(self, names, buckets):
+        self.names = names
+        self.buckets = buckets
+        self.query_cache = _QueryCache()
+        self.refs = 0
+        self._trigrams = None
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def trigrams(self):
+        """The trigram index of the names, built the first time it is
+        needed."""
+        with self._lock:
+            if self._trigrams is None:
+                self._trigrams = TrigramIndex(self.names)
+        return self._trigrams
+
+    def blob(self, count):
+        """The newline joined names of the rows with count pins or pads,
+        built the first time it is needed."""
+        with self._lock:
+            blob = self._blobs.get(count)
+            if blob is None:
+                rows = self.buckets.get(count, _NO_ROWS)
+                blob = NameBlob(list(self.names[rows]))
+                if len(rows):
+                    self._blobs[count] = blob
+        return blob
+
+    def match_rows(self, count, name, engine="scan", stats=None):
+        """Returns the positions of the rows with count pins or pads whose
+        name matches the name regex, in row order. engine picks how the
+        names are searched, see _ENGINES. stats is a Stats or None."""
+        regex = _compile_name(name)
+        key = (count, regex.pattern, regex.flags)
+        rows = self.query_cache.get(key)
+        if rows is None:
+            candidates = self.buckets.get(count, _NO_ROWS)
+            with phase(stats, "name search"):
+                if engine == "trigram":
+                    rows = self.trigrams().search(self.names, candidates, regex)
+                elif engine == "blob":
+                    rows = self.blob(count).search(self.names, candidates, regex)
+                else:
+                    rows = scan_search(self.names, candidates, regex)
+            self.query_cache.put(key, rows)
+            if stats is not None:
+                stats.count("rows scanned", len(candidates))
+                stats.count("rows matched", len(rows))
+        elif stats is not None:
+            stats.count("query cache hits")
+        return rows
+
+    def matches(self, count, name, engine="scan", stats=None):
+        return _widen(self.df.iloc[self.match_rows(count, name, engine, stats)])
+
+    def value(self, column, row):
+        return self.df[column].iat[row]
+
+    def first_row(self, count, name, engine="scan", stats=None):
+        """Returns the position of the first row, in row order, with count
+        pins or pads whose name matches the name regex, or None. The names
+        after the first match aren't searched."""
+        regex = _compile_name(name)
+        key = (count, regex.pattern, regex.flags, "first")
+        rows = self.query_cache.get(key)
+        if rows is None:
+            candidates = self.buckets.get(count, _NO_ROWS)
+            with phase(stats, "name search"):
+                if engine == "trigram":
+                    row = self.trigrams().first(self.names, candidates, regex)
+                elif engine == "blob":
+                    row = self.blob(count).first(self.names, candidates, regex)
+                else:
+                    row = scan_first(self.names, candidates, regex)
+            rows = _NO_ROWS if row is None else np.array([row], dtype=np.intp)
+            self.query_cache.put(key, rows)
+            if stats is not None:
+                # the rows up to and including the first match.
+                stats.count(
+                    "rows scanned",
+                    len(candidates) if row is None
+                    else int(np.searchsorted(candidates, row)) + 1,
+                )
+                stats.count("rows matched", len(rows))
+        elif stats is not None:
+            stats.count("query cache hits")
+        return int(rows[0]) if len(rows) else None
+
+
+class _SharedIndex(_Index):
+    """An _Index over the columns share_indexes published. The counts and
+    the row order of each count are used straight from the shared memory
+    and a text value is only decoded when a search or a result needs it.
+    df is built, as a private copy, the first time the whole frame is
+    asked for."""
+
+    def __init__(self, shared, kind, columns):
+        arrays = shared.arrays()
+        self.shared = shared
+        self.columns = {}
+        for column in columns:
+            if column.endswith("_count"):
+                self.columns[column] = arrays[f"{kind}.{column}"]
+            elif f"{kind}.{column}.codes" in arrays:
+                self.columns[column] = CodedStrings(
+                    arrays[f"{kind}.{column}.codes"],
+                    StringTable(
+                        arrays[f"{kind}.{column}.offsets"],
+                        arrays[f"{kind}.{column}.data"],
+                    ),
+                )
+            else:
+                self.columns[column] = StringTable(
+                    arrays[f"{kind}.{column}.offsets"],
+                    arrays[f"{kind}.{column}.data"],
+                )
+        self._init_search(
+            self.columns[columns[0]],
+            _count_buckets(
+                arrays[f"{kind}.order"],
+                arrays[f"{kind}.values"],
+                arrays[f"{kind}.starts"],
+            ),
+        )
+        self._df = None
+
+    @property
+    def df(self):
+        with self._lock:
+            if self._df is None:
+                rows = np.arange(len(self.names))
+                self._df = self._frame(rows).reset_index(drop=True)
+        return self._df
+
+    def _frame(self, rows):
+        return _rows_frame(
+            rows,
+            list(self.columns),
+            [self.columns[column][rows] for column in self.columns],
+        )
+
+    def matches(self, count, name, engine="scan", stats=None):
+        return self._frame(self.match_rows(count, name, engine, stats))
+
+    def value(self, column, row):
+        return self.columns[column][row]
+
+
+def _index_key(csv_path):
+    stat = csv_path.stat()
+    return str(csv_path.resolve()), stat.st_mtime_ns, stat.st_size
+
+
+def _acquire_index(csv_path, columns):
+    """Returns (key, _Index) for csv_path from the cache, loading it if
+    it isn't there or the file has changed. columns[0] is the name and
+    columns[1] the count."""
+    key = _index_key(csv_path)
+    with _index_cache_lock:
+        _let_go_released()
+        index = _index_cache.get(key)
+        if index is not None:
+            index.refs += 1
+            return key, index
+        load_lock = _index_loads.setdefault(key, threading.Lock())
+    with load_lock:
+        with _index_cache_lock:
+            index = _index_cache.get(key)
+            if index is not None:
+                # another thread loaded it while this one waited.
+                index.refs += 1
+                return key, index
+        index = _Index(_read_index(csv_path, columns), columns[0], columns[1])
+        with _index_cache_lock:
+            for old_key in [k for k in _index_cache if k[0] == key[0]]:
+                if _index_cache[old_key].refs == 0:
+                    del _index_cache[old_key]
+            _index_cache[key] = index
+            del _index_loads[key]
+            index.refs += 1
+    return key, index
+
+
+def _release_index(key):
+    with _index_cache_lock:
+        _let_go_released()
+        _let_go(key)
+
+
+def _let_go_released():
+    """Lets go of the keys queued on _released, holding _index_cache_lock."""
+    while _released:
+        _let_go(_released.popleft())
+
+
+def _let_go(key):
+    index = _index_cache.get(key)
+    if index is None:
+        return
+    index.refs -= 1
+    newer = any(k[0] == key[0] and k != key for k in _index_cache)
+    if index.refs <= 0 and newer:
+        del _index_cache[key]
+
+
+def _acquire_shared_index(shared, kind, columns):
+    """As _acquire_index for the index share_indexes published as kind."""
+    key = (f"shared:{shared.name}:{kind}", 0, 0)
+    with _index_cache_lock:
+        _let_go_released()
+        index = _index_cache.get(key)
+        if index is None:
+            index = _index_cache[key] = _SharedIndex(shared, kind, columns)
+        index.refs += 1
+    return key, index
+
+
+def share_indexes(index_dir=None):
+    """Publishes the part and footprint indexes in index_dir (indexes/ in
+    the current directory by default) into shared memory and returns the
+    SharedArrays holding them. Hand it to SearchPart(shared=...) in pool
+    workers and they search the one copy instead of each loading the
+    indexes. Unlink it, or use it in a with block, once the workers are
+    done. Changes to the index files after it is made aren't seen."""
+    import pandas as pd
+
+    index_path = Path.cwd() / "indexes" if index_dir is None else Path(index_dir)
+    arrays = {}
+    for kind, file_name, columns in (
+        ("part", "skidl_part_index.csv", _PART_COLUMNS),
+        ("footprint", "skidl_footprint_index.csv", _FP_COLUMNS),
+    ):
+        index_df = _read_index(index_path / file_name, columns)
+        for column in columns:
+            if column.endswith("_count"):
+                arrays[f"{kind}.{column}"] = index_df[column].to_numpy()
+            elif isinstance(index_df[column].dtype, pd.CategoricalDtype):
+                offsets, data = encode_strings(index_df[column].cat.categories)
+                arrays[f"{kind}.{column}.codes"] = index_df[column].cat.codes
+                arrays[f"{kind}.{column}.offsets"] = offsets
+                arrays[f"{kind}.{column}.data"] = data
+            else:
+                offsets, data = encode_strings(index_df[column])
+                arrays[f"{kind}.{column}.offsets"] = offsets
+                arrays[f"{kind}.{column}.data"] = data
+        order, values, starts = _bucket_order(index_df[columns[1]].to_numpy())
+        arrays[f"{kind}.order"] = order
+        arrays[f"{kind}.values"] = values
+        arrays[f"{kind}.starts"] = starts
+    return SharedArrays(arrays)
+
+
+def clear_index_cache():
+    """Empties the shared index cache so the next SearchPart loads the
+    indexes from disk. SearchParts that already exist keep their frames."""
+    with _index_cache_lock:
+        _released.clear()
+        _index_cache.clear()
+
+
+## skidl.Part templates keyed by (lib, name, footprint). Building a Part
+## reads its symbol from the library, copying a template doesn't. Parts
+## made with any of the _BUILD_ARGS, or with list values (which copy()
+## would take as a request for several parts), are always built.
+_part_templates = {}
+_part_templates_lock = threading.Lock()
+_BUILD_ARGS = {
+    "dest",
+    "tool",
+    "connections",
+    "part_defn",
+    "circuit",
+    "ref_prefix",
+    "tag",
+    "pin_splitters",
+}
+
+
+def clear_part_cache():
+    """Forgets the Part templates so the next parts are read from the
+    libraries again, eg after a library was edited."""
+    with _part_templates_lock:
+        _part_templates.clear()
+
+
+def _make_part(lib, name, footprint, kwargs, use_cache=True):
+    """Returns a skidl.Part, copied from the cached template when it can
+    be. A circuit kwarg is where the copy goes, not a reason to build."""
+    if (
+        not use_cache
+        or _BUILD_ARGS.intersection(kwargs) - {"circuit"}
+        or any(isinstance(v, (list, tuple)) for v in kwargs.values())
+    ):
+        return skidl.Part(lib, name, footprint=footprint, **kwargs)
+
+    key = (lib, name, footprint)
+    with _part_templates_lock:
+        template = _part_templates.get(key)
+        if template is None:
+            template = skidl.Part(
+                lib, name, dest=skidl.TEMPLATE, footprint=footprint
+            )
+            _part_templates[key] = template
+    return template.copy(**kwargs)
+
+
+## The files whose contents decide what a lockfile resolution would be.
+## The manifests change whenever a library is added, edited or removed.
+_INDEX_FILES = [
+    ("skidl_part_manifest.json", "skidl_part_index.csv"),
+    ("skidl_footprint_manifest.json", "skidl_footprint_index.csv"),
+]
+
+
+def _index_stamp(index_path):
+    """Returns a hash of the index manifests and index sizes in
+    index_path, without loading the indexes. An index built before there
+    were manifests is stamped with its mtime."""
+    sha = hashlib.sha1()
+    for manifest, csv in _INDEX_FILES:
+        manifest_path = index_path / manifest
+        csv_path = index_path / csv
+        if manifest_path.is_file():
+            sha.update(manifest_path.read_bytes())
+        if csv_path.is_file():
+            stat = csv_path.stat()
+            sha.update(f"{csv}:{stat.st_size}".encode())
+            if not manifest_path.is_file():
+                sha.update(f":{stat.st_mtime_ns}".encode())
+    return sha.hexdigest()
+
+
+def _lib_name(location):
+    """The library to hand skidl, the index location without its .lib or
+    .kicad_sym extension."""
+    for extension in (".lib", ".kicad_sym"):
+        if location.endswith(extension):
+            return location[: -len(extension)]
+    return location
+
+
+def _lock_key(pin_count, name, fp_name, pad_count):
+    return json.dumps([pin_count, name, fp_name, pad_count])
+
+
+class PartNotFound(IndexError):
+    """No part in the index has the pin count and a name matching the
+    regex."""
+
+
+class FootprintNotFound(IndexError):
+    """No footprint in the index has the pad count and a name matching the
+    regex."""
+
+
+## The exceptions an index server can send back that are raised as they
+## are, anything else is raised as an Exception.
+_SERVER_ERRORS = {
+    "PartNotFound": PartNotFound,
+    "FootprintNotFound": FootprintNotFound,
+    "AssertionError": AssertionError,
+    # a bad name regex.
+    "error": re.error,
+    "PatternError": re.error,
+}
+
 
 class SearchPart(object):
-    def __init__(self):
+    def __init__(
+        self,
+        engine="scan",
+        part_cache=True,
+        lockfile=None,
+        instrument=False,
+        index_dir=None,
+        server=None,
+        shared=None,
+    ):
+        assert engine in _ENGINES
+        self.engine = engine
+        # instrument=True records timings and counts, see stats().
+        self._stats = Stats("SearchPart") if instrument else None
+        # part_cache=False builds every skidl.Part from its library.
+        self.part_cache = part_cache
+        # create_part answers are kept in lockfile, see _read_lockfile.
+        self.lockfile = None if lockfile is None else Path(lockfile)
+        self._locked = {}
+        self._index_stamp = None
         #  self.load_indexes()
-        self.part_df = pd.DataFrame()
-        self.fp_df = pd.DataFrame()
-        self._load_indexes()
+        self._part_index = None
+        self._fp_index = None
+        self._index_keys = []
+        self._client = None
+        # shared is what share_indexes returned, the indexes it holds are
+        # searched in place of the index files.
+        self._shared = shared
+        # index_dir defaults to indexes/ in the current directory.
+        self._load_indexes(index_dir)
+        # server=True (or the path of its socket) sends the queries to an
+        # index server, see index_server.py. Without one running the
+        # indexes are loaded here as usual.
+        if server:
+            self._connect(socket_path(self._index_path) if server is True else server)
+
+    def _connect(self, socket_file):
+        try:
+            self._client = IndexClient(socket_file)
+        except OSError:
+            print(f"No index server at {socket_file}, loading the indexes.")
+
+    def _ask_server(self, *request):
+        """Returns the index server's answer to the request, or None if
+        there is no server any more and the query has to be run here.
+        Raises the exception the server raised."""
+        if self._client is None:
+            return None
+        try:
+            with phase(self._stats, "index server"):
+                ok, result = self._client.request(*request)
+        except OSError as e:
+            print(f"Lost the index server ({e}), loading the indexes.")
+            self._client.close()
+            self._client = None
+            return None
+        if self._stats is not None:
+            self._stats.count("index server queries")
+        if not ok:
+            error, message = result
+            raise _SERVER_ERRORS.get(error, Exception)(message)
+        return result
+
+    def close(self):
+        """Lets go of the shared indexes and the index server."""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        for key in self._index_keys:
+            _release_index(key)
+        self._index_keys = []
+        self._part_index = None
+        self._fp_index = None
+
+    def __del__(self):
+        # no locks here, see _released.
+        try:
+            if self._client is not None:
+                self._client.close()
+            _released.extend(self._index_keys)
+        except (TypeError, AttributeError):
+            # the module globals are already gone at interpreter exit.
+            pass
 
     def _load_indexes(self, index_dir=None):
+        """Points the SearchPart at an index directory. Each index is read
+        the first time part_df or fp_df is used."""
         if index_dir is None:
             index_path = Path.cwd() / "indexes"
         else:
             index_path = Path(index_dir)
 
-        if index_path.exists():
-            if index_path.is_dir():
-                index_path_list = list(
-                    index_path.glob("skidl_footprint_index.csv")
-                )
-                if len(index_path_list) > 0 and index_path_list[0].is_file():
-                    fp_index_path = index_path_list[0]
-                else:
-                    # abandon all hope.
+        # shared indexes answer every query, the directory is only needed
+        # to stamp a lockfile.
+        if self._shared is None:
+            if index_path.exists():
+                if not index_path.is_dir():
+                    # the path is bad
                     raise Exception(
-                        f"Footprint index file cannot be found at:{fp_index_path}"
+                        f"Path to index directory is a file:{index_path}"
                     )
-
-                index_path_list = list(index_path.glob("skidl_part_index.csv"))
-                if len(index_path_list) > 0 and index_path_list[0].is_file():
-                    part_index_path = index_path_list[0]
-                else:
-                    # abandon all hope.
-                    raise Exception(
-                        f"Part index file cannot be found at:{part_index_path}"
-                    )
-
             else:
-                # the path is bad
+                # path doesn't exist
                 raise Exception(
-                    f"Path to index directory is a file:{index_path}"
+                    f"Index directory cannot be found at:{index_path}"
                 )
-        else:
-            # path doesn't exist
-            raise Exception(
-                f"Index directory cannot be found at:{index_path}"
+
+        self.close()
+        self._index_path = index_path
+        self._read_lockfile()
+
+    def _read_lockfile(self):
+        """Loads the resolutions recorded in the lockfile. They are thrown
+        away if the indexes have been rebuilt from different libraries
+        since they were recorded."""
+        self._locked = {}
+        if self.lockfile is None:
+            return
+        self._index_stamp = _index_stamp(self._index_path)
+        if not self.lockfile.is_file():
+            return
+        with open(self.lockfile, "r", encoding="UTF-8") as l_file:
+            lock = json.load(l_file)
+        if self._stats is not None:
+            self._stats.read(self.lockfile, self.lockfile.stat().st_size)
+        if lock.get("index_stamp") != self._index_stamp:
+            print(
+                f"The indexes have changed since {self.lockfile} was written,"
+                " parts will be searched for again."
+            )
+            return
+        self._locked = lock.get("resolutions", {})
+
+    def _record(self, resolutions):
+        """Adds the {key: resolution} dict to the lockfile."""
+        if self.lockfile is None or not resolutions:
+            return
+        self._locked.update(resolutions)
+        lock = {"index_stamp": self._index_stamp, "resolutions": self._locked}
+        tmp_file = self.lockfile.with_name(self.lockfile.name + ".tmp")
+        with open(tmp_file, "w", encoding="UTF-8") as l_file:
+            json.dump(lock, l_file, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.lockfile)
+
+    def _acquire(self, file_name, columns, kind):
+        index_file = self._index_path / file_name
+        if self._shared is None and not index_file.is_file():
+            # abandon all hope.
+            raise Exception(f"{kind} index file cannot be found at:{index_file}")
+        with phase(self._stats, f"load {kind.lower()} index"):
+            if self._shared is not None:
+                key, index = _acquire_shared_index(
+                    self._shared, kind.lower(), columns
+                )
+            else:
+                key, index = _acquire_index(index_file, columns)
+        self._index_keys.append(key)
+        if self._stats is not None:
+            self._stats.count(f"{kind.lower()} index rows", len(index.names))
+        return index
+
+    @property
+    def part_index(self):
+        if self._part_index is None:
+            self._part_index = self._acquire(
+                "skidl_part_index.csv", _PART_COLUMNS, "Part"
             )
+        return self._part_index
+
+    @property
+    def fp_index(self):
+        if self._fp_index is None:
+            self._fp_index = self._acquire(
+                "skidl_footprint_index.csv", _FP_COLUMNS, "Footprint"
+            )
+        return self._fp_index
+
+    @property
+    def part_df(self):
+        return self.part_index.df
 
-        self.part_df = pd.read_csv(part_index_path)
-        self.fp_df = pd.read_csv(fp_index_path)
+    @property
+    def fp_df(self):
+        return self.fp_index.df
 
     def query_part(self, pin_count, name):
-        """Returns a list of index records based on the input pin_count
-        and filtered by name"""
+        """Returns the library and name of the first part in the index with
+        pin_count pins whose name matches name. Raises PartNotFound if there
+        isn't one."""
         assert isinstance(pin_count, int)
         assert isinstance(name, str)
-        filter_df = self.part_df[self.part_df.pin_count == pin_count]
-        filter_df = filter_df[filter_df.part_name.str.contains(name.upper(), case=False, regex=True)]
-        lib = filter_df.location.values[0]
-        p_name = filter_df.part_name.values[0]
+        found = self._ask_server("query_part", pin_count, name)
+        if found is not None:
+            return tuple(found)
+        with phase(self._stats, "query_part"):
+            row = self.part_index.first_row(
+                pin_count, name, self.engine, self._stats
+            )
+        if row is None:
+            raise PartNotFound(f"No part with {pin_count} pins matches:{name}")
+        lib = self.part_index.value("location", row)
+        p_name = self.part_index.value("part_name", row)
 
-        return lib[:-4], p_name
+        return _lib_name(lib), p_name
 
     def query_part_return_all(self, pin_count, name):
         assert pin_count is not None
@@ -97,53 +815,243 @@ class SearchPart(object):
         assert name is not None
         assert isinstance(name, str) and name != ""
 
-        filter_df = self.part_df[self.part_df.pin_count == pin_count]
-        return filter_df[filter_df.part_name.str.contains(name.upper(), case=False, regex=True)]
+        found = self._ask_server("query_part_return_all", pin_count, name)
+        if found is not None:
+            return _rows_frame(*found)
+        with phase(self._stats, "query_part_return_all"):
+            return self.part_index.matches(
+                pin_count, name, self.engine, self._stats
+            )
 
     def query_footprint(self, pad_count, name):
-        """Returns a list of index records based on the pad count
-        and filtered by the name."""
-        k_mod = "Not implemented"
-        fp_name = "Not implemented"
+        """Returns the library and name of the first footprint in the index
+        with pad_count pads whose name matches name. Raises
+        FootprintNotFound if there isn't one."""
         assert isinstance(pad_count, int)
         assert isinstance(name, str)
-        filter_df = self.fp_df[self.fp_df.pad_count == pad_count]
-        filter_df = filter_df[filter_df.name.str.contains(name.upper(), case=False, regex=True)]
-        # take the first one
-        k_mod = filter_df.location.values[0]
-        fp_name = filter_df.name.values[0]
+        found = self._ask_server("query_footprint", pad_count, name)
+        if found is not None:
+            return tuple(found)
+        with phase(self._stats, "query_footprint"):
+            row = self.fp_index.first_row(
+                pad_count, name, self.engine, self._stats
+            )
+        if row is None:
+            raise FootprintNotFound(
+                f"No footprint with {pad_count} pads matches:{name}"
+            )
+        k_mod = self.fp_index.value("location", row)
+        fp_name = self.fp_index.value("name", row)
 
         return k_mod, fp_name
 
 
     def query_footprint_return_all(self, pad_count, name, by_pad_count=True):
         """Returns a data frame that has been filtered by pin_count and name.
-        by_pad_count= True filters by pad_count first then by name.
-        by_pad_count=False filters by name first then pad_count.
+        by_pad_count is kept for older callers, both orders of filtering
+        give the same rows so the pad count is always looked up first.
         """
         assert by_pad_count is not None
         assert pad_count is not None and pad_count > -1
         assert name is not None and name != ""
 
-        if by_pad_count:
-            filter_df = self.fp_df[self.fp_df.pad_count == pad_count]
-            return filter_df[filter_df.name.str.contains(name.upper(), case=False, regex=True)]
-        else:
-            filter_df = self.fp_df[self.fp_df.name.str.contains(name.upper(), case=False, regex=True)]
-            return filter_df[filter_df.pad_count == pad_count]
+        found = self._ask_server(
+            "query_footprint_return_all", pad_count, name, by_pad_count
+        )
+        if found is not None:
+            return _rows_frame(*found)
+        with phase(self._stats, "query_footprint_return_all"):
+            return self.fp_index.matches(
+                pad_count, name, self.engine, self._stats
+            )
+
+    def query_cache_info(self):
+        """Returns the hit and miss counts and sizes of the name search
+        caches of the loaded indexes. The caches are shared with every
+        SearchPart using the same index files."""
+        info = {}
+        if self._part_index is not None:
+            info["part"] = self._part_index.query_cache.info()
+        if self._fp_index is not None:
+            info["footprint"] = self._fp_index.query_cache.info()
+        return info
+
+    def clear_query_cache(self):
+        for index in (self._part_index, self._fp_index):
+            if index is not None:
+                index.query_cache.clear()
 
     def create_part(self, pin_count, name, fp_name, pad_count=None, **kwargs):
         if pad_count is None:
             pad_count = pin_count
 
-        lib, name = self.query_part(pin_count, name)
-        fp_mod, fp_name = self.query_footprint(pad_count, fp_name)
-        p_art = skidl.Part(
-            lib, name, footprint=f"{fp_mod[:-7]}:{fp_name}", **kwargs
-        )
+        key = _lock_key(pin_count, name, fp_name, pad_count)
+        resolved = self._locked.get(key)
+        if self._stats is not None:
+            self._stats.count("create_part calls")
+            if resolved is not None:
+                self._stats.count("lockfile hits")
+        if resolved is None:
+            lib, p_name = self.query_part(pin_count, name)
+            fp_mod, f_name = self.query_footprint(pad_count, fp_name)
+            resolved = {
+                "lib": lib,
+                "part_name": p_name,
+                "footprint": f"{fp_mod[:-7]}:{f_name}",
+            }
+            self._record({key: resolved})
+        with phase(self._stats, "skidl part"):
+            p_art = _make_part(
+                resolved["lib"],
+                resolved["part_name"],
+                resolved["footprint"],
+                kwargs,
+                self.part_cache,
+            )
 
         return p_art
 
+    def _first_rows(self, index, queries):
+        """Returns {(count, name): first matching row or None} for the
+        (count, name) queries, searching each count bucket for its names
+        in turn."""
+        by_count = {}
+        for count, name in queries:
+            by_count.setdefault(count, set()).add(name)
+        rows = {}
+        for count in sorted(by_count):
+            for name in sorted(by_count[count]):
+                rows[(count, name)] = index.first_row(
+                    count, name, self.engine, self._stats
+                )
+        return rows
+
+    def _first_matches(self, kind, queries):
+        """Returns {(count, name): (library, name) or None} for the
+        (count, name) queries of the part or footprint index, the answers
+        query_part or query_footprint would give."""
+        if self._client is not None:
+            query = self.query_part if kind == "part" else self.query_footprint
+            found = {}
+            for count, name in sorted(queries):
+                try:
+                    found[(count, name)] = query(count, name)
+                except IndexError:
+                    found[(count, name)] = None
+            return found
+        if kind == "part":
+            index, name_column, lib_name = self.part_index, "part_name", _lib_name
+        else:
+            index, name_column, lib_name = self.fp_index, "name", str
+        rows = self._first_rows(index, queries)
+        return {
+            query: None
+            if row is None
+            else (
+                lib_name(index.value("location", row)),
+                index.value(name_column, row),
+            )
+            for query, row in rows.items()
+        }
+
+    def _resolve_specs(self, specs):
+        """Returns (kwargs, report) lists for create_parts specs."""
+        batch = []
+        for spec in specs:
+            assert 3 <= len(spec) <= 5
+            pin_count, name, fp_name, pad_count, kwargs = (
+                tuple(spec) + (None, None)
+            )[:5]
+            assert isinstance(pin_count, int)
+            assert isinstance(name, str) and isinstance(fp_name, str)
+            if pad_count is None:
+                pad_count = pin_count
+            assert isinstance(pad_count, int)
+            batch.append((pin_count, name, fp_name, pad_count, kwargs or {}))
+
+        # specs already in the lockfile don't need the indexes.
+        pending = [
+            spec for spec in batch if _lock_key(*spec[:4]) not in self._locked
+        ]
+        parts = {}
+        fps = {}
+        if pending:
+            parts = self._first_matches(
+                "part", {(spec[0], spec[1]) for spec in pending}
+            )
+            missing = [
+                f"{c} pins:{n}" for (c, n), found in parts.items() if found is None
+            ]
+            if missing:
+                raise PartNotFound("No part matches: " + ", ".join(missing))
+            fps = self._first_matches(
+                "footprint", {(spec[3], spec[2]) for spec in pending}
+            )
+            missing = [
+                f"{c} pads:{n}" for (c, n), found in fps.items() if found is None
+            ]
+            if missing:
+                raise FootprintNotFound(
+                    "No footprint matches: " + ", ".join(missing)
+                )
+
+        kwargs_list = []
+        report = []
+        new = {}
+        for pin_count, name, fp_name, pad_count, kwargs in batch:
+            key = _lock_key(pin_count, name, fp_name, pad_count)
+            resolved = self._locked.get(key) or new.get(key)
+            if resolved is None:
+                lib, p_name = parts[(pin_count, name)]
+                fp_mod, f_name = fps[(pad_count, fp_name)]
+                resolved = new[key] = {
+                    "lib": lib,
+                    "part_name": p_name,
+                    "footprint": f"{fp_mod[:-7]}:{f_name}",
+                }
+            kwargs_list.append(kwargs)
+            report.append(
+                dict(
+                    pin_count=pin_count,
+                    name=name,
+                    fp_name=fp_name,
+                    pad_count=pad_count,
+                    **resolved,
+                )
+            )
+        self._record(new)
+
+        return kwargs_list, report
+
+    def create_parts(self, specs):
+        """Creates a part for each (pin_count, name, fp_name, pad_count,
+        kwargs) spec, pad_count and kwargs can be left off or None.
+        Each distinct name and footprint regex is searched for once.
+        Returns (parts, report) where report has a dict for each spec
+        giving the library, part and footprint it resolved to. Raises
+        PartNotFound or FootprintNotFound, naming every spec that didn't
+        resolve, before any part is made."""
+        with phase(self._stats, "resolve specs"):
+            kwargs_list, report = self._resolve_specs(specs)
+        with phase(self._stats, "skidl part"):
+            parts = [
+                _make_part(
+                    r["lib"], r["part_name"], r["footprint"], kwargs, self.part_cache
+                )
+                for kwargs, r in zip(kwargs_list, report)
+            ]
+        if self._stats is not None:
+            self._stats.count("create_parts specs", len(specs))
+
+        return parts, report
+
+    def stats(self):
+        """Returns the timings and counts recorded since the SearchPart was
+        made with instrument=True, as a dict, or {} when it wasn't."""
+        if self._stats is None:
+            return {}
+        return self._stats.as_dict()
+
     def __str__(self):
         out_str = self.part_df.to_string(max_rows=10)
 
@@ -0,0 +1,11 @@
+## The scripts in indexes/ import each other as top level modules, as they
+## do when run from that directory.
+
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+sys.path.insert(0, str(REPO / "indexes"))
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
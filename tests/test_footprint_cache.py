@@ -0,0 +1,66 @@
+## A library whose fp-info-cache entries don't agree with a parse of its
+## files is parsed instead of taken from the cache.
+
+import shutil
+
+import pandas as pd
+import pytest
+
+from conftest import FIXTURES
+import index_footprints
+from index_stats import Stats
+
+QUIRKS = FIXTURES / "Quirks.pretty"
+
+
+def _write_cache(cache_path, entries):
+    lines = ["1700000000"]
+    for order, (lib, name, pad_count) in enumerate(entries):
+        lines += [lib, name, "", "", str(order), str(pad_count), str(pad_count)]
+    cache_path.write_text("\n".join(lines) + "\n", encoding="UTF-8")
+
+
+@pytest.fixture
+def modules(tmp_path, monkeypatch):
+    modules = tmp_path / "modules"
+    for lib, names in (
+        ("Good", ["CRLF_Endings", "Header_Then_Pad", "Unnumbered_Pads",
+                  "Wrapped_Name"]),
+        ("Bad", ["CRLF_Endings", "Noncontiguous", "Unnumbered_Pads"]),
+    ):
+        (modules / f"{lib}.pretty").mkdir(parents=True)
+        for name in names:
+            shutil.copy(
+                QUIRKS / f"{name}.kicad_mod",
+                modules / f"{lib}.pretty" / f"{name}.kicad_mod",
+            )
+    monkeypatch.chdir(tmp_path)
+    return modules
+
+
+def test_libraries_that_disagree_with_the_cache_are_parsed(modules, tmp_path):
+    cache_path = tmp_path / "fp-info-cache"
+    _write_cache(
+        cache_path,
+        [
+            ("Good", "CRLF_Endings", 3),
+            # not checked, it isn't first, middle or last.
+            ("Good", "Header_Then_Pad", 5),
+            ("Good", "Unnumbered_Pads", 2),
+            ("Good", "Wrapped_Name", 2),
+            ("Bad", "CRLF_Endings", 3),
+            # KiCad counts all four pads, the parser the first run of two.
+            ("Bad", "Noncontiguous", 4),
+            ("Bad", "Unnumbered_Pads", 2),
+        ],
+    )
+    stats = index_footprints.create_footprint_index_from_cache(
+        modules, cache_path, stats=Stats("test", summary_at_exit=False)
+    )
+    fp_df = pd.read_csv("skidl_footprint_index.csv")
+    counts = dict(zip(fp_df.location + ":" + fp_df.name, fp_df.pad_count))
+    assert counts["Bad.pretty:Noncontiguous"] == 2
+    assert counts["Good.pretty:Header_Then_Pad"] == 5
+    assert stats.counts["files from cache"] == 4
+    assert stats.counts["files parsed"] == 3
+    assert stats.counts["files checked against cache"] == 5
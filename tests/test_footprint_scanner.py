@@ -0,0 +1,53 @@
+## The byte scanner has to give the pyparsing grammar's answers, quirks
+## included, or the footprint index changes.
+
+import pytest
+
+from conftest import FIXTURES
+import index_footprints
+
+QUIRKS = FIXTURES / "Quirks.pretty"
+
+## (name, pad_count) of each (module fixture, None where both paths reject
+## it. The quirks are what the grammar has always done.
+EXPECTED = {
+    # only the first unbroken run of pads is counted.
+    "Noncontiguous": ("Noncontiguous", 2),
+    # (pad "" ...) pads are matched but not counted.
+    "Unnumbered_Pads": ("Unnumbered_Pads", 2),
+    "CRLF_Endings": ("CRLF_Endings", 3),
+    # the closing quote is kept, a space ends the name.
+    "Quoted_Name": ('Quoted_Name"', 2),
+    "Quoted_Name_Spaces": ("Quoted", 1),
+    "Wrapped_Header": ("Wrapped_Header", 2),
+    "Wrapped_Name": ("Wrapped_Name", 2),
+    # the rest of the header line is the next line, the first pad goes.
+    "Header_Then_Pad": ("Header_Then_Pad", 2),
+    # names end at the first non-ASCII character.
+    "Non_ASCII_Name": ("R_Widerstand_10k", 2),
+    "Non_ASCII_First": None,
+}
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_scanner_matches_grammar(name):
+    data = (QUIRKS / f"{name}.kicad_mod").read_bytes()
+    scanned, parsed = index_footprints._scanner_and_grammar(data)
+    assert scanned == parsed == EXPECTED[name]
+
+
+def test_crlf_fixture_kept_its_line_endings():
+    data = (QUIRKS / "CRLF_Endings.kicad_mod").read_bytes()
+    assert data.count(b"\r\n") == data.count(b"\n") > 0
+
+
+def test_footprint_files_are_skipped_not_matched(capsys):
+    data = (QUIRKS / "KiCad6_Footprint.kicad_mod").read_bytes()
+    assert index_footprints._scanner_and_grammar(data) is None
+    # the index reads them with the S-expression scanner.
+    assert index_footprints._parse_kicad_mod_data(data) == ("KiCad6_Footprint", 2)
+
+    assert index_footprints.check_footprint_scanner(QUIRKS) == []
+    out = capsys.readouterr().out
+    assert f"Checked {len(EXPECTED)} footprints, 0 mismatches" in out
+    assert "skipped 1 (footprint files" in out
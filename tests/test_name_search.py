@@ -0,0 +1,97 @@
+## Every engine has to give the rows scan_search gives, in the same order.
+
+import re
+
+import numpy as np
+import pytest
+
+from name_search import NameBlob, TrigramIndex, scan_first, scan_search
+
+NAMES = [
+    "AB",
+    "CXD",
+    "R_0805_2012Metric",
+    "R_0805",
+    "C_0805_2012Metric",
+    "",
+    "LM358",
+    "lm358n",
+    "74HC00",
+    "PinHeader_1x04_P2.54mm_Vertical",
+    "PinHeader_2x02_P2.54mm_Horizontal",
+    "Ω_Resistor",
+    "A",
+    "B",
+    "x.y",
+    "aaa",
+]
+
+PATTERNS = [
+    "R_0805",
+    "^R_",
+    "0805$",
+    "^$",
+    "2.54",
+    "pinheader.*2.54.*vertical$",
+    "A[^X]*$",
+    "(?>A[^X]*)$",
+    "A[^X]*+$",
+    "(?>A|AB)$",
+    "A.*+B",
+    "[^X]+$",
+    "A[^Z]*B",
+    "(?s)A.*$",
+    "\\AB",
+    "B\\Z",
+    "\\bB",
+    "B\\B",
+    "(?<=A)B",
+    "A(?=\\n)",
+    "(?<!C)X",
+    "LM358(?!n)",
+    "(a)\\1",
+    "a{3}",
+    "x|y",
+    "\\d{4}",
+    "Ω",
+    "^(?:R|C)_.*Metric$",
+]
+
+
+def _engines(names, rows):
+    trigrams = TrigramIndex(names)
+    blob = NameBlob(list(names[rows]))
+    return {
+        "trigram": (trigrams.search, trigrams.first),
+        "blob": (blob.search, blob.first),
+    }
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+@pytest.mark.parametrize("flags", [0, re.IGNORECASE])
+def test_engines_match_scan(pattern, flags):
+    names = np.array(NAMES, dtype=object)
+    rows = np.arange(len(names), dtype=np.intp)
+    regex = re.compile(pattern, flags)
+    expected = scan_search(names, rows, regex)
+    first = scan_first(names, rows, regex)
+    for engine, (search, find_first) in _engines(names, rows).items():
+        assert list(search(names, rows, regex)) == list(expected), engine
+        assert find_first(names, rows, regex) == first, engine
+
+
+def test_engines_match_scan_on_some_rows():
+    names = np.array(NAMES, dtype=object)
+    rows = np.array([1, 3, 4, 9, 12], dtype=np.intp)
+    for pattern in PATTERNS:
+        regex = re.compile(pattern, re.IGNORECASE)
+        expected = list(scan_search(names, rows, regex))
+        for engine, (search, _) in _engines(names, rows).items():
+            assert list(search(names, rows, regex)) == expected, (engine, pattern)
+
+
+def test_atomic_patterns_are_not_run_over_the_blob():
+    blob = NameBlob(["AB", "CXD"])
+    for pattern in ("(?>A[^X]*)$", "A[^X]*+$"):
+        assert blob.find(re.compile(pattern)) is None
+    assert blob.find(re.compile("A[^X]*$")) == [0]
@@ -0,0 +1,94 @@
+## Parts copied from a cached template have to match parts built from the
+## library, refs included.
+
+import pytest
+import skidl
+
+from conftest import FIXTURES
+import search_part
+
+LIBRARY = FIXTURES / "library" / "Test.lib"
+
+## (pin_count, name, fp_name, kwargs), made in this order.
+SPECS = [
+    (2, "^R$", "R_0805", {}),
+    (2, "^R$", "R_0805", {"ref": "RX"}),
+    (2, "^R$", "R_0805", {"ref": "RX"}),
+    (2, "^R$", "R_0805", {"value": "10k"}),
+    (2, "^R$", "R_0805", {"ref": "RX", "value": "4k7"}),
+    (8, "LM2904", "SOIC-8", {"value": "LM2904"}),
+    (8, "LM358", "SOIC-8", {"ref": "U"}),
+    (8, "LM358", "SOIC-8", {"ref": "U"}),
+]
+
+
+def _summary(part):
+    return {
+        "name": part.name,
+        "ref": part.ref,
+        "value": part.value,
+        "footprint": part.footprint,
+        "description": getattr(part, "description", None),
+        "keywords": getattr(part, "keywords", None),
+        "pins": [(str(pin.num), pin.name, str(pin.func)) for pin in part.pins],
+    }
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    """An index of Test.lib and a few footprints, with skidl reading
+    legacy .lib files."""
+    index_path = tmp_path / "indexes"
+    index_path.mkdir()
+    location = str(LIBRARY)
+    (index_path / "skidl_part_index.csv").write_text(
+        "part_name,pin_count,location,alias\n"
+        f"R,2,{location},R\n"
+        f"LM358,8,{location},LM358\n"
+        f"LM2904,8,{location},LM358\n",
+        encoding="UTF-8",
+    )
+    (index_path / "skidl_footprint_index.csv").write_text(
+        "name,pad_count,location\n"
+        "R_0805,2,Resistor_SMD.pretty\n"
+        "SOIC-8,8,Package_SO.pretty\n",
+        encoding="UTF-8",
+    )
+    monkeypatch.chdir(tmp_path)
+    tool = skidl.get_default_tool()
+    skidl.set_default_tool("kicad5")
+    search_part.clear_part_cache()
+    yield index_path
+    search_part.clear_part_cache()
+    search_part.clear_index_cache()
+    skidl.set_default_tool(tool)
+
+
+def _make_all(index_dir, part_cache):
+    search = search_part.SearchPart(index_dir=index_dir, part_cache=part_cache)
+    circuit = skidl.Circuit()
+    parts = [
+        search.create_part(pin_count, name, fp_name, circuit=circuit, **kwargs)
+        for pin_count, name, fp_name, kwargs in SPECS
+    ]
+    search.close()
+    return [_summary(part) for part in parts]
+
+
+def test_copied_parts_match_built_parts(index_dir):
+    built = _make_all(index_dir, part_cache=False)
+    assert not search_part._part_templates
+    copied = _make_all(index_dir, part_cache=True)
+    assert len(search_part._part_templates) == 3
+
+    assert copied == built
+
+
+def test_copied_refs_are_made_unique(index_dir):
+    copied = _make_all(index_dir, part_cache=True)
+    refs = [summary["ref"] for summary in copied]
+    # a ref that is taken gets the next free number.
+    assert refs == ["R1", "RX", "RX1", "R2", "RX2", "U1", "U", "U2"]
+    assert [summary["value"] for summary in copied][3:6] == ["10k", "4k7", "LM2904"]
+    assert copied[0]["footprint"] == "Resistor_SMD:R_0805"
+    assert [pin[0] for pin in copied[5]["pins"]] == [str(n) for n in range(1, 9)]